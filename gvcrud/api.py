@@ -0,0 +1,318 @@
+import base64
+import binascii
+import json
+from collections import Counter
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.db import IntegrityError
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.generic import View
+# --------------------------------------------------------------------
+from .models import NaturalPerson
+from .utils.bulk import bulk_create_natural_persons, bulk_update_natural_persons, bulk_delete_natural_persons
+from .utils.pagination import KeysetPaginator, get_page_size
+from .utils.records import RECORD_FIELDS, validate_record
+from .utils.storage import picture_storage
+from .utils.validator import Validator
+# --------------------------------------------------------------------
+
+API_FIELDS = (
+    'id', 'name', 'email', 'cpf', 'gender', 'birthday', 'income_range',
+    'status', 'description', 'picture', 'created_at', 'updated_at'
+)
+UPDATABLE_FIELDS = tuple(field for field in RECORD_FIELDS if field != 'cpf')
+
+class ApiError(Exception):
+
+    def __init__(self, status, message, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.errors = errors
+
+# --------------------------------------------------------------------
+
+class ApiMixin(object):
+    # JSON in, JSON out. Clients authenticate with the login session (and
+    # then send the CSRF token like the HTML forms do) or with HTTP Basic
+    # credentials, which are not sent automatically by browsers and so
+    # need no CSRF token.
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            self.authenticate(request)
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            return self.error_response(error)
+
+    def authenticate(self, request):
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Basic '):
+            try:
+                username, _, password = base64.b64decode(header[6:]).decode().partition(':')
+            except (binascii.Error, UnicodeDecodeError):
+                raise ApiError(401, 'Invalid credentials.')
+            user = authenticate(request, username=username, password=password)
+            if user is None:
+                raise ApiError(401, 'Invalid credentials.')
+            request.user = user
+            return
+        if not request.user.is_authenticated:
+            raise ApiError(401, 'Authentication required.')
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            rejected = CsrfViewMiddleware(lambda request: None).process_view(request, None, (), {})
+            if rejected is not None:
+                raise ApiError(403, 'CSRF verification failed.')
+
+    def error_response(self, error):
+        body = {'detail': error.message}
+        if error.errors is not None:
+            body['errors'] = error.errors
+        return JsonResponse(body, status=error.status)
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        response = super().http_method_not_allowed(request, *args, **kwargs)
+        return JsonResponse({'detail': 'Method not allowed.'}, status=405, headers={'Allow': response['Allow']})
+
+    def read_body(self):
+        try:
+            return json.loads(self.request.body or b'null')
+        except ValueError:
+            raise ApiError(400, 'Request body is not valid JSON.')
+
+    def read_object(self):
+        body = self.read_body()
+        if not isinstance(body, dict):
+            raise ApiError(400, 'Expected a JSON object.')
+        return body
+
+    def read_array(self):
+        body = self.read_body()
+        if not isinstance(body, list) or not all(isinstance(item, dict) for item in body):
+            raise ApiError(400, 'Expected a JSON array of objects.')
+        limit = getattr(settings, 'GVCRUD_API_MAX_BULK', 5000)
+        if len(body) > limit:
+            raise ApiError(400, f'At most {limit} records per request.')
+        return body
+
+    def get_fields(self):
+        requested = self.request.GET.get('fields')
+        if not requested:
+            return API_FIELDS
+        fields = tuple(dict.fromkeys(field.strip() for field in requested.split(',') if field.strip()))
+        unknown = [field for field in fields if field not in API_FIELDS]
+        if unknown:
+            raise ApiError(400, f"Unknown fields: {', '.join(unknown)}.")
+        return fields
+
+    def serialize(self, row, fields):
+        data = {field: row[field] if isinstance(row, dict) else getattr(row, field) for field in fields}
+        if 'picture' in data:
+            name = data['picture'].name if hasattr(data['picture'], 'name') else data['picture']
+            data['picture'] = picture_storage().url(name) if name else None
+        return data
+
+    def check_unknown(self, record, allowed):
+        unknown = [field for field in record if field not in allowed]
+        if unknown:
+            return {field: ['Unknown or read-only field.'] for field in unknown}
+        return {}
+
+# --------------------------------------------------------------------
+
+class NaturalPersonListApi(ApiMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        paginator = KeysetPaginator(
+            NaturalPerson.objects.values(*dict.fromkeys(fields + KeysetPaginator.fields)),
+            per_page=get_page_size(request.GET.get('page_size'))
+        )
+        page = paginator.page(request.GET.get('cursor'))
+        return JsonResponse({
+            'results': [self.serialize(row, fields) for row in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+
+    def post(self, request, *args, **kwargs):
+        record = self.read_object()
+        errors = self.check_unknown(record, RECORD_FIELDS)
+        values, field_errors = validate_record(record)
+        errors.update(field_errors)
+        if not errors:
+            registered = Validator().find_registered(emails=[values['email']], cpfs=[values['cpf']])
+            if values['email'].lower() in registered['email']:
+                errors['email'] = ['E-mail already is registered.']
+            if values['cpf'] in registered['cpf']:
+                errors['cpf'] = ['CPF already is registered.']
+        if errors:
+            raise ApiError(400, 'Invalid record.', errors)
+        person = NaturalPerson(**values)
+        try:
+            person.save()
+        except IntegrityError:
+            raise ApiError(409, 'E-mail or CPF already is registered.')
+        return JsonResponse(self.serialize(person, API_FIELDS), status=201)
+
+class NaturalPersonDetailApi(ApiMixin, View):
+
+    def get_object(self, pk):
+        try:
+            return NaturalPerson.objects.get(pk=pk)
+        except NaturalPerson.DoesNotExist:
+            raise ApiError(404, 'Not found.')
+
+    def get(self, request, pk, *args, **kwargs):
+        fields = self.get_fields()
+        row = NaturalPerson.objects.filter(pk=pk).values(*fields).first()
+        if row is None:
+            raise ApiError(404, 'Not found.')
+        return JsonResponse(self.serialize(row, fields))
+
+    def patch(self, request, pk, *args, **kwargs):
+        record = self.read_object()
+        person = self.get_object(pk)
+        errors = self.check_unknown(record, UPDATABLE_FIELDS)
+        values, field_errors = validate_record(record, fields=[field for field in UPDATABLE_FIELDS if field in record])
+        errors.update(field_errors)
+        if not errors and 'email' in values and values['email'].lower() != person.email.lower():
+            if Validator().find_registered(emails=[values['email']], instance=person)['email']:
+                errors['email'] = ['E-mail already is registered.']
+        if errors:
+            raise ApiError(400, 'Invalid record.', errors)
+        for field, value in values.items():
+            setattr(person, field, value)
+        try:
+            person.save()
+        except IntegrityError:
+            raise ApiError(409, 'E-mail already is registered.')
+        return JsonResponse(self.serialize(person, API_FIELDS))
+
+    def delete(self, request, pk, *args, **kwargs):
+        self.get_object(pk).delete()
+        return HttpResponse(status=204)
+
+# --------------------------------------------------------------------
+
+class NaturalPersonBulkApi(ApiMixin, View):
+    # Whole batches are validated first and then written in one transaction
+    # with batched statements; if any record is rejected nothing is written
+    # and every problem is reported by its position in the array.
+
+    def raise_for_errors(self, errors):
+        if errors:
+            raise ApiError(400, 'Invalid records; nothing was written.', [
+                {'index': index, 'errors': record_errors} for index, record_errors in sorted(errors.items())
+            ])
+
+    def post(self, request, *args, **kwargs):
+        records = self.read_array()
+        validator = Validator()
+        cpf_mask, cpfs = validator.validate_cpf_batch([str(record.get('cpf') or '') for record in records])
+        errors = {}
+        valid = []
+        for index, (record, cpf_ok, cpf) in enumerate(zip(records, cpf_mask, cpfs)):
+            record_errors = self.check_unknown(record, RECORD_FIELDS)
+            values, field_errors = validate_record(record, cpf_check=(cpf_ok, cpf))
+            record_errors.update(field_errors)
+            if record_errors:
+                errors[index] = record_errors
+            else:
+                valid.append((index, values))
+
+        registered = validator.find_registered(
+            emails=[values['email'] for _, values in valid],
+            cpfs=[values['cpf'] for _, values in valid]
+        )
+        seen_emails = set()
+        seen_cpfs = set()
+        for index, values in valid:
+            email = values['email'].lower()
+            if email in registered['email'] or email in seen_emails:
+                errors.setdefault(index, {})['email'] = ['E-mail already is registered.']
+            if values['cpf'] in registered['cpf'] or values['cpf'] in seen_cpfs:
+                errors.setdefault(index, {})['cpf'] = ['CPF already is registered.']
+            seen_emails.add(email)
+            seen_cpfs.add(values['cpf'])
+        self.raise_for_errors(errors)
+
+        try:
+            persons = bulk_create_natural_persons([NaturalPerson(**values) for _, values in valid])
+        except IntegrityError:
+            raise ApiError(409, 'E-mail or CPF already is registered; nothing was written.')
+        return JsonResponse({'created': [self.serialize(person, API_FIELDS) for person in persons]}, status=201)
+
+    def patch(self, request, *args, **kwargs):
+        records = self.read_array()
+        errors = {}
+        pks = []
+        for index, record in enumerate(records):
+            if not isinstance(record.get('id'), int):
+                errors[index] = {'id': ['An integer id is required.']}
+            else:
+                pks.append(record['id'])
+        if len(set(pks)) != len(pks):
+            raise ApiError(400, 'Each id may appear only once.')
+        found = NaturalPerson.objects.in_bulk(pks)
+
+        updates = []
+        fields = set()
+        for index, record in enumerate(records):
+            if index in errors:
+                continue
+            person = found.get(record['id'])
+            if person is None:
+                errors[index] = {'id': ['Not found.']}
+                continue
+            changes = {field: value for field, value in record.items() if field != 'id'}
+            record_errors = self.check_unknown(changes, UPDATABLE_FIELDS)
+            values, field_errors = validate_record(changes, fields=[field for field in UPDATABLE_FIELDS if field in changes])
+            record_errors.update(field_errors)
+            if record_errors:
+                errors[index] = record_errors
+                continue
+            updates.append((index, person, values))
+            fields.update(values)
+
+        # Only e-mails that really change need checking. Persons outside the
+        # batch are checked in the database; the batch's own e-mails are
+        # checked as they will be after it, so two persons may swap theirs.
+        changed = {
+            index: values['email'].lower() for index, person, values in updates
+            if 'email' in values and values['email'].lower() != person.email.lower()
+        }
+        taken = Validator().find_registered(
+            emails=changed.values(), exclude=[person.pk for _, person, _ in updates]
+        )['email']
+        final = Counter(values.get('email', person.email).lower() for _, person, values in updates)
+        for index, email in changed.items():
+            if email in taken or final[email] > 1:
+                errors.setdefault(index, {})['email'] = ['E-mail already is registered.']
+        self.raise_for_errors(errors)
+
+        previous = []
+        persons = []
+        for _, person, values in updates:
+            previous.append(NaturalPerson(pk=person.pk, gender=person.gender, income_range=person.income_range))
+            for field, value in values.items():
+                setattr(person, field, value)
+            persons.append(person)
+        try:
+            bulk_update_natural_persons(persons, sorted(fields), previous=previous)
+        except IntegrityError:
+            raise ApiError(409, 'E-mail already is registered; nothing was written.')
+        return JsonResponse({'updated': [self.serialize(person, API_FIELDS) for person in persons]})
+
+    def delete(self, request, *args, **kwargs):
+        body = self.read_body()
+        pks = body.get('ids') if isinstance(body, dict) else body
+        if not isinstance(pks, list) or not all(isinstance(pk, int) for pk in pks):
+            raise ApiError(400, 'Expected {"ids": [...]} or an array of integer ids.')
+        deleted = bulk_delete_natural_persons(pks)
+        missing = sorted(set(pks) - set(deleted))
+        return JsonResponse({'deleted': deleted, 'missing': missing})
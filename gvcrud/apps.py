@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class GvcrudConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gvcrud'
+
+    def ready(self):
+        from . import signals
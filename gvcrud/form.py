@@ -151,8 +151,10 @@ class NaturalPersonForm(PersonForm):
         )
     )
      
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, upload_errors=None, **kwargs):
         super(NaturalPersonForm, self).__init__(*args, **kwargs)
+        # Problems PictureUploadHandler found while the upload streamed in.
+        self.upload_errors = upload_errors or {}
         for field in self.fields.values():
             field.required = False    
         if self.instance and self.instance.pk:
@@ -177,16 +179,21 @@ class NaturalPersonForm(PersonForm):
         return Validator().validate_name(self.cleaned_data.get('name'))
     
     def clean_email(self):
-        return Validator().validate_email(self.cleaned_data.get('email'), self.instance)
+        return Validator().validate_email_format(self.cleaned_data.get('email'))
     
     def clean_picture(self):
+        if self.upload_errors.get('picture'):
+            raise forms.ValidationError(self.upload_errors['picture'])
         return Validator().validate_picture(self.cleaned_data.get('picture'))
     
     def clean_status(self):
         return Validator().validate_status(self.cleaned_data.get('status'))
     
     def clean_cpf(self):
-        return Validator().validate_cpf(self.cleaned_data.get('cpf'))
+        cpf = Validator().validate_cpf(self.cleaned_data.get('cpf'))
+        if self.instance and self.instance.pk and cpf != self.instance.cpf:
+            raise forms.ValidationError('CPF cannot be changed.')
+        return cpf
     
     def clean_birthday(self):
         return Validator().validate_birthday(self.cleaned_data.get('birthday'))
@@ -197,6 +204,29 @@ class NaturalPersonForm(PersonForm):
     def clean_income_range(self):
         return Validator().validate_income_range(self.cleaned_data.get('income_range'))
 
+    def clean(self):
+        cleaned_data = super(NaturalPersonForm, self).clean()
+        email = cleaned_data.get('email')
+        cpf = cleaned_data.get('cpf')
+        registered = Validator().find_registered(
+            emails=[email] if email else [], 
+            cpfs=[cpf] if cpf and not self.instance.pk else [], 
+            instance=self.instance
+        )
+        if email and email.strip().lower() in registered['email']:
+            self.add_error('email', 'E-mail already is registered.')
+        if cpf in registered['cpf']:
+            self.add_error('cpf', 'CPF already is registered.')
+        return cleaned_data
+
+    def _get_validation_exclusions(self):
+        # The clean_* methods and clean() already apply every rule the model
+        # would check for these fields, uniqueness included, so the model's
+        # field validators and constraint queries would only repeat them.
+        exclude = super(NaturalPersonForm, self)._get_validation_exclusions()
+        exclude.update(('name', 'email', 'cpf', 'gender', 'birthday', 'income_range'))
+        return exclude
+
 # ------------------------------------------------
 
 class LegalPersonForm(PersonForm):
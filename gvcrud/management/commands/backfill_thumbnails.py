@@ -0,0 +1,62 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+# --------------------------------------------------------------------
+from gvcrud.models import Person
+from gvcrud.utils.thumbnails import generate_thumbnails, get_thumbnail_sizes
+# --------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = 'Generates missing picture thumbnails for every stored person, in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Pictures processed at the same time.'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate thumbnails that already exist.'
+        )
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            help='Only these sizes. Defaults to GVCRUD_THUMBNAIL_SIZES.'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be positive.')
+        sizes = tuple(options['sizes'] or get_thumbnail_sizes())
+        names = (
+            Person.objects.exclude(picture='').exclude(picture__isnull=True)
+            .order_by().values_list('picture', flat=True).distinct()
+        )
+        started = time.monotonic()
+        generated = skipped = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(generate_thumbnails, name, sizes=sizes, force=options['force']): name
+                for name in names.iterator()
+            }
+            for future in as_completed(futures):
+                try:
+                    created = future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {error}')
+                    continue
+                if created:
+                    generated += 1
+                else:
+                    skipped += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Thumbnails generated for {generated} pictures, {skipped} already up to date, '
+            f'{failed} failed in {elapsed:.1f}s.'
+        ))
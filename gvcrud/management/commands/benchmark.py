@@ -0,0 +1,274 @@
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.utils import get_random_secret_key
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+# --------------------------------------------------------------------
+from gvcrud.models import NaturalPerson
+from gvcrud.utils.pagination import KeysetPaginator
+from gvcrud.utils.seed import LAST_NAMES, seed_natural_persons
+# --------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = 'Seeds a test database with natural persons and times the main views at each size.'
+
+    scenarios = ('list', 'list_page', 'search', 'detail', 'update_form', 'update', 'reports')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000],
+            help='Row counts to measure at, e.g. --sizes 1000 100000 1000000.'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Timed requests per view and size.'
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=2,
+            help='Untimed requests per view before timing.'
+        )
+        parser.add_argument(
+            '--scenario',
+            choices=self.scenarios,
+            action='append',
+            help='Only run these views. May be given more than once.'
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Clear every cache before each request instead of measuring with warm caches.'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed of the data generator and of the record picks.'
+        )
+        parser.add_argument(
+            '--output',
+            default='benchmark.json',
+            help='Where to write the results as JSON.'
+        )
+        parser.add_argument(
+            '--compare',
+            help='Results of an earlier run to compare against.'
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the test database, and the rows seeded into it, for the next run.'
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(set(options['sizes']))
+        if sizes[0] < 1:
+            raise CommandError('--sizes must be positive.')
+        if options['repeat'] < 1 or options['warmup'] < 0:
+            raise CommandError('--repeat must be positive and --warmup cannot be negative.')
+        previous = self.load(options['compare']) if options['compare'] else None
+        self.options = options
+        self.rng = random.Random(options['seed'])
+
+        # Never the real database: a test database is created for the run
+        # and dropped afterwards unless --keepdb is given.
+        try:
+            settings.SECRET_KEY
+        except ImproperlyConfigured:
+            # The checked-in settings leave SECRET_KEY empty; the sessions
+            # only live for this run, so any key will do.
+            settings.SECRET_KEY = get_random_secret_key()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            # Only "default" is swapped for the test database, so reads are
+            # kept off the read replicas, which hold the real data.
+            with override_settings(ALLOWED_HOSTS=['testserver'], GVCRUD_REPLICAS=()):
+                results = self.run(sizes, options['scenario'] or self.scenarios)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'warmup': options['warmup'],
+                'cold': options['cold'],
+                'seed': options['seed'],
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+        if previous is not None:
+            self.compare(previous, report)
+
+    def load(self, path):
+        try:
+            with open(path, encoding='utf-8') as source:
+                return json.load(source)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+
+    # ----------------------------------------------------------------
+
+    def run(self, sizes, scenarios):
+        user, _ = User.objects.get_or_create(username='benchmark', defaults={'is_staff': True})
+        self.client = Client()
+        self.client.force_login(user)
+        results = {}
+        for size in sizes:
+            existing = NaturalPerson.objects.count()
+            if existing < size:
+                started = time.monotonic()
+                seed_natural_persons(size - existing, start=existing, seed=self.options['seed'])
+                self.stdout.write(f'Seeded {size - existing} rows in {time.monotonic() - started:.1f}s.')
+            self.pks = list(NaturalPerson.objects.order_by('?').values_list('pk', flat=True)[:100])
+            results[str(size)] = {}
+            for scenario in scenarios:
+                result = self.measure(getattr(self, f'request_{scenario}'))
+                results[str(size)][scenario] = result
+                self.stdout.write(
+                    f"{size:>9} {scenario:<12} p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+                    f"{result['queries_max']:3} queries  {result['peak_memory_kb']:8.0f} KB"
+                )
+        return results
+
+    def measure(self, prepare):
+        for _ in range(self.options['warmup']):
+            self.send(*prepare())
+        timings = []
+        queries = []
+        for _ in range(self.options['repeat']):
+            call, path, data = prepare()
+            if self.options['cold']:
+                for cache in caches.all():
+                    cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = call(path, data)
+                elapsed = time.perf_counter() - started
+            self.check_response(response)
+            timings.append(elapsed * 1000)
+            queries.append(len(captured))
+
+        # tracemalloc slows everything down, so the peak comes from one
+        # extra request rather than from the timed ones.
+        call, path, data = prepare()
+        tracemalloc.start()
+        try:
+            response = call(path, data)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.check_response(response)
+
+        timings.sort()
+        return {
+            'requests': len(timings),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'min_ms': round(timings[0], 3),
+            'p50_ms': round(self.percentile(timings, 50), 3),
+            'p90_ms': round(self.percentile(timings, 90), 3),
+            'p99_ms': round(self.percentile(timings, 99), 3),
+            'max_ms': round(timings[-1], 3),
+            'queries_min': min(queries),
+            'queries_max': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def percentile(self, values, rank):
+        # Nearest rank, like the income percentiles of the report.
+        return values[max(0, (len(values) * rank + 99) // 100 - 1)]
+
+    def send(self, call, path, data):
+        self.check_response(call(path, data))
+
+    def check_response(self, response):
+        if response.status_code >= 400:
+            raise CommandError(f'{response.request["PATH_INFO"]} answered {response.status_code}.')
+        if response.request['REQUEST_METHOD'] == 'POST' and response.status_code == 200:
+            raise CommandError(f'{response.request["PATH_INFO"]} rejected the form.')
+
+    # ----------------------------------------------------------------
+
+    # Each request_* method picks what to ask for and returns the client
+    # call; only the call itself is timed and counted.
+
+    def pick(self):
+        return self.rng.choice(self.pks)
+
+    def request_list(self):
+        return self.client.get, reverse('natural-list'), {}
+
+    def request_list_page(self):
+        # A page somewhere deep in the list, reached by its keyset cursor.
+        paginator = KeysetPaginator(NaturalPerson.objects.all())
+        row = NaturalPerson.objects.filter(pk=self.pick()).values(*paginator.fields).get()
+        return self.client.get, reverse('natural-list'), {'cursor': paginator.encode_cursor(row, 'next')}
+
+    def request_search(self):
+        return self.client.get, reverse('natural-list'), {'search': self.rng.choice(LAST_NAMES)}
+
+    def request_detail(self):
+        return self.client.get, reverse('natural-detail', args=[self.pick()]), {}
+
+    def request_update_form(self):
+        return self.client.get, reverse('natural-update', args=[self.pick()]), {}
+
+    def request_update(self):
+        person = NaturalPerson.objects.get(pk=self.pick())
+        return self.client.post, reverse('natural-update', args=[person.pk]), {
+            'name': person.name,
+            'email': person.email,
+            'cpf': person.cpf,
+            'gender': person.gender,
+            'birthday': person.birthday.strftime('%d/%m/%Y'),
+            'income_range': str(person.income_range).replace('.', ','),
+            'status': 'on' if person.status else '',
+            'description': person.description or '',
+        }
+
+    def request_reports(self):
+        return self.client.get, reverse('natural-reports'), {}
+
+    # ----------------------------------------------------------------
+
+    def compare(self, previous, current):
+        self.stdout.write('')
+        self.stdout.write(f"{'size':>9} {'view':<12} {'p50 before':>11} {'p50 now':>9} {'change':>8} {'queries':>9}")
+        for size, scenarios in current['results'].items():
+            for scenario, result in scenarios.items():
+                before = previous.get('results', {}).get(size, {}).get(scenario)
+                if before is None:
+                    continue
+                change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+                line = (
+                    f"{size:>9} {scenario:<12} {before['p50_ms']:>11.1f} {result['p50_ms']:>9.1f} "
+                    f"{change:>+7.1f}% {before['queries_max']:>4} → {result['queries_max']}"
+                )
+                if result['queries_max'] > before['queries_max'] or change > 20:
+                    line = self.style.WARNING(line)
+                self.stdout.write(line)
@@ -0,0 +1,69 @@
+import posixpath
+import re
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+# --------------------------------------------------------------------
+from gvcrud.models import Person
+from gvcrud.utils.storage import get_min_age, picture_storage
+# --------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = 'Deletes stored pictures (and their thumbnails) that no person refers to.'
+
+    thumbnail_pattern = re.compile(r'^(?P<root>.+)_\d+\.webp$')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            help='Minutes a file must have existed before it may be deleted, so uploads still being saved are kept '
+                 '(default: GVCRUD_PICTURE_MIN_AGE).'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list what would be deleted.'
+        )
+
+    def handle(self, *args, **options):
+        if options['min_age'] is not None and options['min_age'] < 0:
+            raise CommandError('--min-age cannot be negative.')
+        storage = picture_storage()
+        directory = Person._meta.get_field('picture').upload_to
+        if not storage.exists(directory):
+            self.stdout.write('No pictures stored.')
+            return
+        min_age = get_min_age() if options['min_age'] is None else timedelta(minutes=options['min_age'])
+        cutoff = timezone.now() - min_age
+        referenced = set(
+            Person.objects.exclude(picture='').exclude(picture__isnull=True)
+            .order_by().values_list('picture', flat=True).distinct()
+        )
+        referenced_roots = {posixpath.splitext(name)[0] for name in referenced}
+
+        deleted = 0
+        freed = 0
+        for name in self.walk(storage, directory):
+            thumbnail = self.thumbnail_pattern.match(name)
+            if name in referenced or (thumbnail and thumbnail.group('root') in referenced_roots):
+                continue
+            if storage.get_modified_time(name) > cutoff:
+                continue
+            size = storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(f'Would delete {name} ({size} bytes).')
+            else:
+                storage.delete(name)
+            deleted += 1
+            freed += size
+
+        verb = 'Would free' if options['dry_run'] else 'Freed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {freed} bytes in {deleted} files.'))
+
+    def walk(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield posixpath.join(directory, name)
+        for child in directories:
+            yield from self.walk(storage, posixpath.join(directory, child))
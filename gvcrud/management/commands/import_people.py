@@ -0,0 +1,172 @@
+import csv
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+# --------------------------------------------------------------------
+from gvcrud.models import NaturalPerson
+from gvcrud.utils.bulk import bulk_create_natural_persons
+from gvcrud.utils.records import text, validate_record
+from gvcrud.utils.validator import Validator
+# --------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = 'Imports natural persons from a CSV or JSON-lines file in validated batches.'
+
+    fields = ('name', 'email', 'cpf', 'gender', 'birthday', 'income_range', 'status', 'description', 'picture')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or a JSON-lines file.')
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'jsonl'),
+            help='Input format. Guessed from the file extension when omitted.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows validated and inserted per batch.'
+        )
+        parser.add_argument(
+            '--rejected',
+            help='Where to write rejected rows as CSV. Defaults to <path>.rejected.csv.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate everything without writing to the database.'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        self.dry_run = options['dry_run']
+        self.seen_emails = set()
+        self.seen_cpfs = set()
+        self.imported = 0
+        self.rejected = 0
+        self.started = time.monotonic()
+
+        rejected_path = options['rejected'] or f'{path}.rejected.csv'
+        try:
+            source = open(path, newline='', encoding='utf-8')
+        except OSError as error:
+            raise CommandError(f'Cannot open {path}: {error}')
+        with source, open(rejected_path, 'w', newline='', encoding='utf-8') as rejected_file:
+            self.rejected_writer = csv.writer(rejected_file)
+            self.rejected_writer.writerow(('line', 'errors') + self.fields)
+            batch = []
+            for line, row in self.read_rows(source, file_format):
+                batch.append((line, row))
+                if len(batch) >= batch_size:
+                    self.import_batch(batch)
+                    batch = []
+            if batch:
+                self.import_batch(batch)
+
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Validated" if self.dry_run else "Imported"} {self.imported} rows, '
+            f'rejected {self.rejected} in {elapsed:.1f}s.'
+        ))
+        if self.rejected:
+            self.stdout.write(f'Rejected rows written to {rejected_path}.')
+
+    def read_rows(self, source, file_format):
+        if file_format == 'csv':
+            for line, row in enumerate(csv.DictReader(source), start=2):
+                yield line, row
+            return
+        for line, text in enumerate(source, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else {'__error__': 'Invalid JSON line.'}
+
+    def import_batch(self, batch):
+        valid = []
+        cpf_mask, cpfs = Validator().validate_cpf_batch(
+            [self.text(row.get('cpf')) for _, row in batch]
+        )
+        for (line, row), cpf_ok, cpf in zip(batch, cpf_mask, cpfs):
+            person, errors = self.validate_row(row, cpf_ok, cpf)
+            if errors:
+                self.reject(line, row, errors)
+            else:
+                valid.append((line, row, person))
+
+        valid = self.check_uniqueness(valid)
+        if valid and not self.dry_run:
+            try:
+                bulk_create_natural_persons([person for _, _, person in valid])
+            except IntegrityError:
+                # Someone registered one of these concurrently; isolate it.
+                inserted = []
+                for line, row, person in valid:
+                    try:
+                        bulk_create_natural_persons([person])
+                        inserted.append((line, row, person))
+                    except IntegrityError as error:
+                        self.reject(line, row, [str(error)])
+                valid = inserted
+        # Only what was inserted (or would be, on a dry run) is taken, so a
+        # row rejected above does not reject later rows with its values.
+        for _, _, person in valid:
+            self.seen_emails.add(person.email.lower())
+            self.seen_cpfs.add(person.cpf)
+        self.imported += len(valid)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(
+            f'{self.imported} rows imported, {self.rejected} rejected '
+            f'({self.imported / elapsed if elapsed else 0:.0f} rows/s).'
+        )
+
+    def validate_row(self, row, cpf_ok, cpf):
+        if '__error__' in row:
+            return None, [row['__error__']]
+        values, errors = validate_record(row, cpf_check=(cpf_ok, cpf))
+        if errors:
+            return None, [f'{field}: {message}' for field, messages in errors.items() for message in messages]
+        values['picture'] = self.text(row.get('picture')) or None
+        return NaturalPerson(**values), []
+
+    def check_uniqueness(self, valid):
+        # One query per batch for both unique columns instead of one per row.
+        registered = Validator().find_registered(
+            emails=[person.email for _, _, person in valid], 
+            cpfs=[person.cpf for _, _, person in valid]
+        )
+        taken_emails = registered['email'] | self.seen_emails
+        taken_cpfs = registered['cpf'] | self.seen_cpfs
+        unique = []
+        for line, row, person in valid:
+            errors = []
+            email = person.email.lower()
+            if email in taken_emails:
+                errors.append('email: E-mail already is registered.')
+            if person.cpf in taken_cpfs:
+                errors.append('cpf: CPF already is registered.')
+            if errors:
+                self.reject(line, row, errors)
+                continue
+            # Earlier rows of the same batch.
+            taken_emails.add(email)
+            taken_cpfs.add(person.cpf)
+            unique.append((line, row, person))
+        return unique
+
+    def reject(self, line, row, errors):
+        self.rejected += 1
+        self.rejected_writer.writerow(
+            [line, '; '.join(errors)] + [self.text(row.get(field)) for field in self.fields]
+        )
+
+    def text(self, value):
+        return text(value)
@@ -0,0 +1,81 @@
+import io
+import pstats
+from django.core.management.base import BaseCommand, CommandError
+# --------------------------------------------------------------------
+from gvcrud.utils.profiling import profile_store
+# --------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = 'Lists the request profiles written by ProfilingMiddleware, or shows the hotspots of one.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'name',
+            nargs='?',
+            help='Profile to show: its name, an unambiguous prefix of it, or "latest". Lists them when omitted.'
+        )
+        parser.add_argument(
+            '--view',
+            help='Only list profiles of this view (URL name).'
+        )
+        parser.add_argument(
+            '--sort',
+            choices=('cumulative', 'tottime', 'calls'),
+            default='cumulative',
+            help='Order of the functions shown.'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=25,
+            help='Functions (or profiles, when listing) shown.'
+        )
+
+    def handle(self, *args, **options):
+        if options['limit'] < 1:
+            raise CommandError('--limit must be positive.')
+        if options['name']:
+            self.show(options['name'], options['sort'], options['limit'])
+        else:
+            self.list(options['view'], options['limit'])
+
+    def list(self, view, limit):
+        shown = 0
+        for name in profile_store.names():
+            metadata = profile_store.load(name)
+            if view and metadata['view'] != view:
+                continue
+            self.stdout.write(
+                f"{name}  {metadata['method']:<6} {metadata['status']}  {metadata['duration_ms']:9.1f} ms  "
+                f"{metadata['sql']['count']:4} queries  {metadata['sql']['ms']:8.1f} ms SQL  {metadata['path']}"
+            )
+            shown += 1
+            if shown >= limit:
+                break
+        if not shown:
+            self.stdout.write(f'No profiles in {profile_store.directory}.')
+
+    def show(self, prefix, sort, limit):
+        names = profile_store.find(prefix)
+        if not names:
+            raise CommandError(f'No profile matches "{prefix}".')
+        if len(names) > 1:
+            raise CommandError(f'"{prefix}" matches {len(names)} profiles; give more of the name.')
+        metadata = profile_store.load(names[0])
+        sql = metadata['sql']
+        self.stdout.write(self.style.SUCCESS(
+            f"{metadata['method']} {metadata['path']} ({metadata['view']}) answered {metadata['status']} "
+            f"in {metadata['duration_ms']:.1f} ms; profiled by {metadata['trigger']} at {metadata['recorded_at']}."
+        ))
+        self.stdout.write(f"SQL: {sql['count']} queries in {sql['ms']:.1f} ms.")
+        for query in sql['slowest']:
+            self.stdout.write(f"  {query['ms']:8.2f} ms  {query['sql'][:160]}")
+        if sql['repeated']:
+            self.stdout.write('Repeated statements:')
+            for query in sql['repeated']:
+                self.stdout.write(f"  {query['count']:4}x {query['ms']:8.2f} ms  {query['sql'][:160]}")
+        # self.stdout ends every write with a newline; pstats writes in pieces.
+        output = io.StringIO()
+        stats = pstats.Stats(profile_store.stats_path(names[0]), stream=output)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        self.stdout.write(output.getvalue())
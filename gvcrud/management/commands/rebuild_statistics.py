@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+# --------------------------------------------------------------------
+from gvcrud.models import NaturalPersonStatistics
+# --------------------------------------------------------------------
+
+class Command(BaseCommand):
+    help = 'Rebuilds the natural person statistics row from scratch, reporting any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', 
+            action='store_true', 
+            help='Only report drift, without rebuilding. Fails when drift is found.'
+        )
+
+    def handle(self, *args, **options):
+        drift = NaturalPersonStatistics.verify()
+        if drift:
+            self.stdout.write(self.style.WARNING(f"Drift found in: {', '.join(drift)}."))
+        else:
+            self.stdout.write('No drift found.')
+        if options['check']:
+            if drift:
+                raise CommandError('Statistics are out of date.')
+            return
+        NaturalPersonStatistics.rebuild()
+        self.stdout.write(self.style.SUCCESS('Statistics rebuilt.'))
@@ -0,0 +1,237 @@
+import json
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+# --------------------------------------------------------------------
+from .utils.metrics import RequestTimings, current_timings, install_query_recorder, metrics
+from .utils.profiling import profile_store, start_profiler, stop_profiler, summarize_queries
+from .utils.replicas import RoutingState, current_routing, replica_pool
+# --------------------------------------------------------------------
+
+logger = logging.getLogger('gvcrud.performance')
+
+def get_view_name(request):
+    # Route names keep the label set small; unmatched URLs share one.
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match._func_path
+
+# --------------------------------------------------------------------
+
+class PerformanceMiddleware(object):
+    # Measures each request: wall time, SQL queries and their time, and
+    # template rendering (with TimedDjangoTemplates as the template
+    # backend). The numbers go out as a Server-Timing header, as one JSON
+    # log line on the "gvcrud.performance" logger and into the counters
+    # served at /metrics. Streamed bodies (the exports) are produced after
+    # the response leaves here, so their queries are not included.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported.
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(None, connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall(self, request):
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.finish(request, response, timings, time.perf_counter() - started)
+
+    def finish(self, request, response, timings, duration):
+        view = get_view_name(request)
+        metrics.observe(view, request.method, response.status_code, duration, timings)
+        if getattr(settings, 'GVCRUD_SERVER_TIMING', True):
+            response['Server-Timing'] = ', '.join((
+                f'total;dur={duration * 1000:.1f}',
+                f'db;dur={timings.sql_time * 1000:.1f};desc="{timings.sql_count} queries"',
+                f'tpl;dur={timings.template_time * 1000:.1f}',
+            ))
+        if logger.isEnabledFor(logging.INFO):
+            record = {
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'sql_count': timings.sql_count,
+                'sql_ms': round(timings.sql_time * 1000, 2),
+                'template_ms': round(timings.template_time * 1000, 2),
+            }
+            logger.info(json.dumps(record), extra={'performance': record})
+        return response
+
+# --------------------------------------------------------------------
+
+class ProfilingMiddleware(object):
+    # Profiles a request with cProfile when it is picked by
+    # GVCRUD_PROFILE_SAMPLE_RATE, or when a staff user sends the
+    # GVCRUD_PROFILE_HEADER header. The profile, the view and a summary of
+    # its SQL are written to the profile store (see "manage.py profiles")
+    # and the response names the profile in X-Profile-Id. Goes after
+    # AuthenticationMiddleware; the user is only loaded when the header is
+    # present, so unprofiled requests cost one random() call.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @property
+    def sample_rate(self):
+        return getattr(settings, 'GVCRUD_PROFILE_SAMPLE_RATE', 0)
+
+    @property
+    def header(self):
+        return getattr(settings, 'GVCRUD_PROFILE_HEADER', 'X-Profile')
+
+    def sampled(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall(request)
+        if self.sampled():
+            trigger = 'sample'
+        elif request.headers.get(self.header) and request.user.is_staff:
+            trigger = 'header'
+        else:
+            return self.get_response(request)
+        profiler, timings, token = self.start()
+        if profiler is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            self.stop(profiler, token)
+        return self.finish(request, response, profiler, timings, trigger, time.perf_counter() - started)
+
+    async def __acall(self, request):
+        if self.sampled():
+            trigger = 'sample'
+        elif request.headers.get(self.header) and (await request.auser()).is_staff:
+            trigger = 'header'
+        else:
+            return await self.get_response(request)
+        profiler, timings, token = self.start()
+        if profiler is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self.stop(profiler, token)
+        return self.finish(request, response, profiler, timings, trigger, time.perf_counter() - started)
+
+    def start(self):
+        profiler = start_profiler()
+        if profiler is None:
+            return None, None, None
+        # PerformanceMiddleware's timings when it runs, our own otherwise.
+        timings = current_timings.get()
+        token = None
+        if timings is None:
+            timings = RequestTimings()
+            token = current_timings.set(timings)
+        timings.queries = []
+        return profiler, timings, token
+
+    def stop(self, profiler, token):
+        stop_profiler(profiler)
+        if token is not None:
+            current_timings.reset(token)
+
+    def finish(self, request, response, profiler, timings, trigger, duration):
+        queries, timings.queries = timings.queries, None
+        name = profile_store.save(profiler, {
+            'view': get_view_name(request),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'trigger': trigger,
+            'recorded_at': datetime.now(timezone.utc).isoformat(),
+            'duration_ms': round(duration * 1000, 3),
+            'sql': summarize_queries(queries),
+        })
+        response['X-Profile-Id'] = name
+        return response
+
+# --------------------------------------------------------------------
+
+class ReplicaMiddleware(object):
+    # Holds the database routing state of each request (see
+    # utils/replicas.py). A request that wrote sets a cookie keeping the
+    # client's reads on the primary for GVCRUD_REPLICA_STICKY_SECONDS, so
+    # the list shown after a form submit has the change even while the
+    # replicas catch up. Without replicas it only keeps the state.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @property
+    def cookie_name(self):
+        return getattr(settings, 'GVCRUD_REPLICA_COOKIE', 'gvcrud_primary')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall(request)
+        state = RoutingState(pinned=self.cookie_name in request.COOKIES)
+        token = current_routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.finish(response, state)
+
+    async def __acall(self, request):
+        state = RoutingState(pinned=self.cookie_name in request.COOKIES)
+        token = current_routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.finish(response, state)
+
+    def finish(self, response, state):
+        window = getattr(settings, 'GVCRUD_REPLICA_STICKY_SECONDS', 10)
+        if state.wrote and window and replica_pool.aliases:
+            response.set_cookie(
+                self.cookie_name, '1', max_age=window, httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE
+            )
+        return response
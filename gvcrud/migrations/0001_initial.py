@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:55
+
+import django.core.validators
+import django.db.models.deletion
+import gvcrud.utils.validator
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Person',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, validators=[django.core.validators.MinLengthValidator(4)], verbose_name='Name')),
+                ('email', models.EmailField(max_length=50, verbose_name='E-mail')),
+                ('picture', models.ImageField(blank=True, null=True, upload_to='person/natural', verbose_name='Picture')),
+                ('status', models.BooleanField(verbose_name='Status')),
+                ('description', models.CharField(blank=True, max_length=200, null=True, verbose_name='Description')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('updated_at', models.DateTimeField(auto_now=True, null=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Person',
+                'verbose_name_plural': 'People',
+                'db_table': 'person',
+                'managed': True,
+            },
+        ),
+        migrations.CreateModel(
+            name='LegalPerson',
+            fields=[
+                ('person_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='gvcrud.person')),
+            ],
+            bases=('gvcrud.person',),
+        ),
+        migrations.CreateModel(
+            name='NaturalPerson',
+            fields=[
+                ('person_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='gvcrud.person')),
+                ('cpf', models.CharField(max_length=11, validators=[gvcrud.utils.validator.Validator.validate_cpf], verbose_name='CPF')),
+                ('gender', models.CharField(choices=gvcrud.utils.validator.Validator.get_genders, max_length=1, validators=[gvcrud.utils.validator.Validator.validate_gender], verbose_name='Gender')),
+                ('birthday', models.DateField(validators=[gvcrud.utils.validator.Validator.validate_birthday], verbose_name='Birthday')),
+                ('income_range', models.DecimalField(decimal_places=2, default=0, max_digits=12, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(9999999999.99)], verbose_name='Income Range')),
+            ],
+            options={
+                'verbose_name': 'Natural Person',
+                'verbose_name_plural': 'Natural Persons',
+                'db_table': 'natural_person',
+                'ordering': ['-created_at'],
+                'managed': True,
+            },
+            bases=('gvcrud.person',),
+        ),
+        migrations.AddConstraint(
+            model_name='person',
+            constraint=models.UniqueConstraint(fields=('email',), name='unq_person_email', violation_error_message='E-mail already is registered.'),
+        ),
+        migrations.AddConstraint(
+            model_name='person',
+            constraint=models.CheckConstraint(condition=models.Q(('updated_at__isnull', True), ('updated_at__gte', models.F('created_at')), _connector='OR'), name='chk_person_updated_at', violation_error_message='"updated_at" date cannot be earlier than "created_at" date.'),
+        ),
+        migrations.AddConstraint(
+            model_name='naturalperson',
+            constraint=models.UniqueConstraint(fields=('cpf',), name='unq_naturalperson_cpf', violation_error_message='CPF already is registered.'),
+        ),
+        migrations.AddConstraint(
+            model_name='naturalperson',
+            constraint=models.CheckConstraint(condition=models.Q(('gender', 'M'), ('gender', 'F'), ('gender', 'O'), _connector='OR'), name='chk_naturalperson_gender', violation_error_message='Invalid gender.'),
+        ),
+        migrations.AddConstraint(
+            model_name='naturalperson',
+            constraint=models.CheckConstraint(condition=models.Q(('income_range__gte', 0), ('income_range__lte', 9999999999.99)), name='chk_naturalperson_income_range', violation_error_message='Invalid income range.'),
+        ),
+    ]
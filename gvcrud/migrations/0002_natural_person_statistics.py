@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gvcrud', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NaturalPersonStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_count', models.PositiveBigIntegerField(default=0, verbose_name='Total Count')),
+                ('total_income', models.DecimalField(decimal_places=2, default=0, max_digits=24, verbose_name='Total Income')),
+                ('male_count', models.PositiveBigIntegerField(default=0, verbose_name='Male Count')),
+                ('female_count', models.PositiveBigIntegerField(default=0, verbose_name='Female Count')),
+                ('other_count', models.PositiveBigIntegerField(default=0, verbose_name='Other Count')),
+                ('max_income', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Highest Income')),
+                ('min_income', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='Lowest Income')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('highest_person', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='gvcrud.naturalperson', verbose_name='Highest Income Person')),
+                ('lowest_person', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='gvcrud.naturalperson', verbose_name='Lowest Income Person')),
+            ],
+            options={
+                'verbose_name': 'Natural Person Statistics',
+                'verbose_name_plural': 'Natural Person Statistics',
+                'db_table': 'natural_person_statistics',
+                'managed': True,
+            },
+        ),
+    ]
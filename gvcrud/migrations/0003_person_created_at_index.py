@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gvcrud', '0002_natural_person_statistics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['created_at', 'id'], name='idx_person_created_at_id'),
+        ),
+    ]
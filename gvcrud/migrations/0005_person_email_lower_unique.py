@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:03
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+FTS_TABLE = 'person_fts'
+
+
+def restore_fts_triggers(apps, schema_editor):
+    # SQLite applies the constraint change by rebuilding the person table,
+    # which drops the triggers 0004 put on it and leaves person_fts frozen.
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+        return
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON person BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON person BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name ON person BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END"
+    )
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gvcrud', '0004_person_search_indexes'),
+    ]
+
+    operations = [
+        # Both directions rebuild the table on SQLite, so the triggers are
+        # restored after it whichever way this migration runs.
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.RemoveConstraint(
+            model_name='person',
+            name='unq_person_email',
+        ),
+        migrations.RemoveIndex(
+            model_name='person',
+            name='idx_person_email_lower',
+        ),
+        migrations.AddConstraint(
+            model_name='person',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='unq_person_email_lower', violation_error_message='E-mail already is registered.'),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:08
+
+import gvcrud.utils.storage
+from django.db import migrations, models
+
+
+FTS_TABLE = 'person_fts'
+
+
+def restore_fts_triggers(apps, schema_editor):
+    # SQLite alters the picture column by rebuilding the person table, which
+    # drops the person_fts triggers (see 0005).
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+        return
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON person BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON person BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name ON person BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END"
+    )
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gvcrud', '0005_person_email_lower_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AlterField(
+            model_name='person',
+            name='picture',
+            field=models.ImageField(blank=True, null=True, storage=gvcrud.utils.storage.picture_storage, upload_to='person/natural', verbose_name='Picture'),
+        ),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gvcrud', '0006_person_picture_content_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='naturalpersonstatistics',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Version'),
+        ),
+    ]
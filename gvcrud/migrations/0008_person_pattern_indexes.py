@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_pattern_indexes(apps, schema_editor):
+    # PostgreSQL only: LIKE 'x%' can use a plain btree index only under the
+    # C collation, so the CPF prefix search gets a pattern_ops index, and
+    # the e-mail contains search a trigram one (names use the trigram index
+    # of migration 0004). SQLite searches by byte-order
+    # ranges over the indexes of migration 0004.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_natural_person_cpf_pattern ON natural_person (cpf varchar_pattern_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_person_email_trgm ON person USING gin (email gin_trgm_ops)'
+    )
+
+
+def drop_pattern_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in ('idx_natural_person_cpf_pattern', 'idx_person_email_trgm'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gvcrud', '0007_natural_person_statistics_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pattern_indexes, drop_pattern_indexes),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+import time
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.core.exceptions import ValidationError
 from django.core.validators import MinLengthValidator, MinValueValidator,  MaxValueValidator
 from django.db.models import UniqueConstraint, CheckConstraint, Q, F
+from django.db.models.functions import Lower
+from .utils.storage import picture_storage, release_pictures
 from .utils.validator import Validator
 
 class Person(models.Model):
@@ -24,7 +29,8 @@ class Person(models.Model):
         verbose_name='Picture', 
         blank=True, 
         null=True, 
-        upload_to='person/natural'
+        upload_to='person/natural',
+        storage=picture_storage
     )
 
     status = models.BooleanField(
@@ -57,15 +63,94 @@ class Person(models.Model):
         auto_now_add=False
     )
 
+    immutable_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._loaded_values = self.__current_values()
+
+    def get_loaded_values(self):
+        # Values as last read from or written to the database, so saves can
+        # diff against them instead of selecting the row again. Instances
+        # built by hand with a pk fall back to one query.
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None and self.pk:
+            attnames = [field.attname for field in self._meta.concrete_fields]
+            loaded = type(self)._base_manager.filter(pk=self.pk).values(*attnames).first()
+            self._loaded_values = loaded
+        return loaded
+
+    def get_changed_fields(self, loaded):
+        changed = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname == self._meta.pk.attname:
+                continue
+            if getattr(field, 'auto_now', False):
+                changed.append(field.attname)
+                continue
+            if field.attname not in loaded:
+                if field.attname in self.__dict__:
+                    changed.append(field.attname)
+                continue
+            value = getattr(self, field.attname)
+            if isinstance(value, models.fields.files.FieldFile) and value and not value._committed:
+                changed.append(field.attname)
+            elif value != loaded[field.attname]:
+                changed.append(field.attname)
+        return changed
+
+    def save(self, *args, **kwargs):
+        loaded = self.get_loaded_values() if self.pk else None
+        if loaded:
+            for field in self.immutable_fields:
+                if field in loaded and getattr(self, field) != loaded[field]:
+                    raise ValidationError({field: f'{self._meta.get_field(field).verbose_name} cannot be changed.'})
+            if kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+                kwargs['update_fields'] = self.get_changed_fields(loaded)
+        super(Person, self).save(*args, **kwargs)
+        self._loaded_values = self.__current_values()
+        if loaded and loaded.get('picture') and loaded['picture'] != self.picture.name:
+            release_pictures([loaded['picture']])
+
+    def picture_thumb_url(self, size):
+        # Falls back to the original while the thumbnail is still being
+        # generated, or for pictures uploaded before thumbnails existed.
+        if not self.picture:
+            return None
+        from .utils.thumbnails import thumbnail_name, thumbnail_size_for
+        thumb = thumbnail_name(self.picture.name, thumbnail_size_for(size))
+        if self.picture.storage.exists(thumb):
+            return self.picture.storage.url(thumb)
+        return self.picture.url
+
+    def __current_values(self):
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                continue
+            value = getattr(self, field.attname)
+            values[field.attname] = value.name if isinstance(value, models.fields.files.FieldFile) else value
+        return values
+
     class Meta:
         db_table = 'person'
         managed = True
         verbose_name = 'Person'
         verbose_name_plural = 'People'
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='idx_person_created_at_id'),
+            models.Index(Lower('name'), name='idx_person_name_lower'),
+        ]
         constraints = [
             UniqueConstraint(
-                fields=['email'], 
-                name='unq_person_email', 
+                Lower('email'), 
+                name='unq_person_email_lower', 
                 violation_error_message='E-mail already is registered.'
             ),
             CheckConstraint(
@@ -113,11 +198,21 @@ class NaturalPerson(Person):
         ]
     )
 
+    immutable_fields = ('cpf',)
+
     def save(self, *args, **kwargs):
-       if self.pk:
-           old = NaturalPerson.objects.get(pk=self.pk)
-           self.cpf = old.cpf
-       super(NaturalPerson, self).save(*args, **kwargs)
+        with transaction.atomic():
+            loaded = self.get_loaded_values() if self.pk else None
+            if loaded and not ('gender' in loaded and 'income_range' in loaded):
+                loaded = NaturalPerson._base_manager.filter(pk=self.pk).values('gender', 'income_range').first()
+            old = None
+            if loaded:
+                old = NaturalPerson(pk=self.pk, gender=loaded['gender'], income_range=loaded['income_range'])
+            super(NaturalPerson, self).save(*args, **kwargs)
+            if old is None or (old.gender, old.income_range) != (self.gender, self.income_range):
+                NaturalPersonStatistics.apply(removed=[old] if old else [], added=[self])
+            else:
+                NaturalPersonStatistics.touch()
 
     def __str__(self):
         return "f{self.pk}: {self.cpf}, {self.name}" 
@@ -142,5 +237,205 @@ class NaturalPerson(Person):
             )
         ]
     
+class NaturalPersonStatistics(models.Model):
+    gender_fields = {'M': 'male_count', 'F': 'female_count', 'O': 'other_count'}
+
+    total_count = models.PositiveBigIntegerField(
+        verbose_name='Total Count', 
+        default=0
+    )
+
+    total_income = models.DecimalField(
+        verbose_name='Total Income', 
+        max_digits=24, 
+        decimal_places=2, 
+        default=0
+    )
+
+    male_count = models.PositiveBigIntegerField(
+        verbose_name='Male Count', 
+        default=0
+    )
+
+    female_count = models.PositiveBigIntegerField(
+        verbose_name='Female Count', 
+        default=0
+    )
+
+    other_count = models.PositiveBigIntegerField(
+        verbose_name='Other Count', 
+        default=0
+    )
+
+    max_income = models.DecimalField(
+        verbose_name='Highest Income', 
+        max_digits=12, 
+        decimal_places=2, 
+        blank=True, 
+        null=True
+    )
+
+    min_income = models.DecimalField(
+        verbose_name='Lowest Income', 
+        max_digits=12, 
+        decimal_places=2, 
+        blank=True, 
+        null=True
+    )
+
+    highest_person = models.ForeignKey(
+        NaturalPerson, 
+        verbose_name='Highest Income Person', 
+        blank=True, 
+        null=True, 
+        on_delete=models.DO_NOTHING, 
+        db_constraint=False, 
+        related_name='+'
+    )
+
+    lowest_person = models.ForeignKey(
+        NaturalPerson, 
+        verbose_name='Lowest Income Person', 
+        blank=True, 
+        null=True, 
+        on_delete=models.DO_NOTHING, 
+        db_constraint=False, 
+        related_name='+'
+    )
+
+    updated_at = models.DateTimeField(
+        verbose_name='Updated At', 
+        auto_now=True
+    )
+
+    # Moves on with every natural person write, inside the writing
+    # transaction, so readers only see a new version once its data is
+    # committed. Report results and page validators are keyed on it.
+    version = models.PositiveBigIntegerField(
+        verbose_name='Version', 
+        default=0
+    )
+
+    @classmethod
+    def get_version(cls, using=None):
+        return cls.objects.using(using).filter(pk=1).values_list('version', flat=True).first()
+
+    @classmethod
+    async def aget_version(cls, using=None):
+        return await cls.objects.using(using).filter(pk=1).values_list('version', flat=True).afirst()
+
+    @classmethod
+    def load(cls):
+        row = cls.objects.select_related('highest_person', 'lowest_person').filter(pk=1).first()
+        return row or cls.rebuild()
+
+    @classmethod
+    async def aload(cls):
+        row = await cls.objects.select_related('highest_person', 'lowest_person').filter(pk=1).afirst()
+        return row or await sync_to_async(cls.rebuild)()
+
+    @classmethod
+    def rebuild(cls):
+        from .utils.reports import ReportEngine
+        snapshot = ReportEngine().scan(NaturalPerson.objects.all())
+        # A row created afresh starts from the clock rather than 0, so the
+        # versions handed out before it went missing are not reused.
+        version = cls.objects.filter(pk=1).values_list('version', flat=True).first()
+        version = time.time_ns() if version is None else version + 1
+        row = cls(pk=1, version=version, **cls.__values_from_snapshot(snapshot))
+        row.save()
+        return row
+
+    @classmethod
+    def verify(cls):
+        from .utils.reports import ReportEngine
+        row = cls.objects.filter(pk=1).first()
+        if row is None:
+            return ['missing']
+        expected = cls.__values_from_snapshot(ReportEngine().scan(NaturalPerson.objects.all()))
+        return [
+            field for field, value in expected.items() 
+            if getattr(row, field) != value
+        ]
+
+    @classmethod
+    def __values_from_snapshot(cls, snapshot):
+        values = {
+            'total_count': snapshot.count,
+            'total_income': snapshot.total_income,
+            'max_income': snapshot.max_income,
+            'min_income': snapshot.min_income,
+            'highest_person_id': snapshot.highest_person.pk if snapshot.highest_person else None,
+            'lowest_person_id': snapshot.lowest_person.pk if snapshot.lowest_person else None,
+        }
+        for gender, field in cls.gender_fields.items():
+            values[field] = snapshot.count_by_gender(gender)
+        return values
+
+    @classmethod
+    def apply(cls, removed=(), added=()):
+        # Called after the rows were written. Totals move by deltas; the
+        # extremes only need a lookup when their current holder went away
+        # or got worse, otherwise the added rows are simply compared. The
+        # holder references are not database constraints, so deleting a
+        # person never cascades into this row.
+        with transaction.atomic():
+            row = cls.objects.select_for_update().filter(pk=1).first()
+            if row is None:
+                cls.rebuild()
+                return
+            changes = {
+                'version': F('version') + 1,
+                'total_count': F('total_count') + len(added) - len(removed),
+                'total_income': F('total_income') 
+                    + sum(cls.__income(person) for person in added) 
+                    - sum(cls.__income(person) for person in removed),
+            }
+            for gender, field in cls.gender_fields.items():
+                delta = (
+                    sum(1 for person in added if person.gender == gender) 
+                    - sum(1 for person in removed if person.gender == gender)
+                )
+                if delta:
+                    changes[field] = F(field) + delta
+            changes.update(cls.__extreme_changes(row, removed, added, 'max_income', 'highest_person_id', 1))
+            changes.update(cls.__extreme_changes(row, removed, added, 'min_income', 'lowest_person_id', -1))
+            cls.objects.filter(pk=1).update(**changes)
+
+    @classmethod
+    def touch(cls):
+        # For writes that leave the statistics as they were.
+        if not cls.objects.filter(pk=1).update(version=F('version') + 1):
+            cls.rebuild()
+
+    @classmethod
+    def __extreme_changes(cls, row, removed, added, income_field, person_field, sign):
+        holder = getattr(row, person_field)
+        current = getattr(row, income_field)
+        still_there = {person.pk: cls.__income(person) for person in added}
+        lost = (holder is None and current is not None) or any(person.pk == holder for person in removed)
+        if lost and holder in still_there and sign * (still_there[holder] - current) >= 0:
+            lost = False
+            current = still_there[holder]
+        if lost:
+            order = ('-' if sign > 0 else '') + 'income_range'
+            extreme = NaturalPerson.objects.order_by(order, '-pk').values_list('pk', 'income_range').first()
+            holder, current = extreme or (None, None)
+        else:
+            for pk, income in still_there.items():
+                if holder is None or sign * (income - current) > 0 or (income == current and pk > holder):
+                    holder, current = pk, income
+        return {income_field: current, person_field: holder}
+
+    @classmethod
+    def __income(cls, person):
+        return NaturalPerson._meta.get_field('income_range').to_python(person.income_range)
+
+    class Meta:
+        db_table = 'natural_person_statistics'
+        managed = True
+        verbose_name = 'Natural Person Statistics'
+        verbose_name_plural = 'Natural Person Statistics'
+
 class LegalPerson(Person):
     pass
@@ -0,0 +1,31 @@
+from django.db import connections
+from django.db.models.signals import post_migrate, post_save, post_delete
+from django.dispatch import receiver
+# --------------------------------------------------------------------
+from .models import NaturalPerson, NaturalPersonStatistics
+from .utils.search import restore_fts_triggers
+from .utils.storage import release_pictures
+from .utils.thumbnails import ThumbnailWorker
+# --------------------------------------------------------------------
+
+@receiver(post_delete, sender=NaturalPerson)
+def update_statistics_on_delete(sender, instance, **kwargs):
+    NaturalPersonStatistics.apply(removed=[instance])
+
+@receiver(post_delete, sender=NaturalPerson)
+def release_picture_on_delete(sender, instance, **kwargs):
+    release_pictures([instance.picture.name])
+
+@receiver(post_save, sender=NaturalPerson)
+def generate_picture_thumbnails(sender, instance, created, update_fields=None, **kwargs):
+    if not instance.picture:
+        return
+    if created or update_fields is None or 'picture' in update_fields:
+        ThumbnailWorker().schedule(instance.picture.name)
+
+@receiver(post_migrate)
+def check_fts_triggers(sender, using, **kwargs):
+    # Catches a migration that rebuilt the person table on SQLite without
+    # recreating the triggers, as 0005 and 0006 do themselves.
+    if sender.name == 'gvcrud':
+        restore_fts_triggers(connections[using])
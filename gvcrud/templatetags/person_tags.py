@@ -0,0 +1,28 @@
+from django import template
+# --------------------------------------------------------------------
+from ..utils.fragments import fragment_cache
+# --------------------------------------------------------------------
+
+register = template.Library()
+
+# --------------------------------------------------------------------
+
+@register.filter
+def picture_thumb(person, size):
+    # {{ person|picture_thumb:150 }}
+    return person.picture_thumb_url(int(size))
+
+@register.simple_tag
+def person_rows(persons, template_name, **extra):
+    # {% person_rows persons "person/list_row.html" %}
+    # The template sees each person as "person" plus the extra arguments;
+    # it must not depend on anything else in the page's context.
+    return fragment_cache.render_many(template_name, persons, extra)
+
+@register.simple_tag
+def person_fragment(person, template_name, **extra):
+    # {% person_fragment highest_income_person "person/report_card.html" title="Highest Income" %}
+    # Values that change without the person being saved, like a thumbnail
+    # URL that only exists once the thumbnail is generated, must be passed
+    # in as extra arguments, which are part of the cache key.
+    return fragment_cache.render_many(template_name, [person], extra)
@@ -1,3 +1,935 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+from decimal import Decimal
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.utils import get_random_secret_key
+from django.db import connection
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from PIL import Image
+# --------------------------------------------------------------------
+from . import urls as gvcrud_urls
+from . import views
+from .models import NaturalPerson, NaturalPersonStatistics
+from .utils.bulk import bulk_create_natural_persons, bulk_delete_natural_persons, bulk_update_natural_persons
+from .utils.cache import report_cache
+from .utils.export import stream_csv, stream_xlsx
+from .utils.metrics import metrics
+from .utils.pagination import KeysetPaginator
+from .utils.profiling import profile_store
+from .utils.replicas import ReplicaRouter, RoutingState, current_routing, replica_pool
+from .utils.reports import ReportEngine, Reports
+from .utils.search import SearchEngine, restore_fts_triggers
+from .utils.storage import picture_storage
+from .utils.thumbnails import delete_thumbnails, generate_thumbnails
+from .utils.seed import cpf_for, generate_natural_persons, seed_natural_persons
+from .utils.uploads import PictureUploadHandler
+from .utils.validator import CPF_VECTORIZE_FROM, Validator
+# --------------------------------------------------------------------
 
-# Create your tests here.
+MEDIA_ROOT = tempfile.mkdtemp(prefix='gvcrud-tests-')
+
+def setUpModule():
+    # The checked-in settings leave SECRET_KEY empty, and sessions need one.
+    try:
+        settings.SECRET_KEY
+    except ImproperlyConfigured:
+        settings.SECRET_KEY = get_random_secret_key()
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+def picture_upload(name='picture.png'):
+    content = io.BytesIO()
+    Image.new('RGB', (32, 32), (200, 40, 40)).save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/png')
+
+def noise_webp_upload(size, name='picture.webp'):
+    # Noise does not compress, so the file is about 3 bytes per pixel.
+    content = io.BytesIO()
+    Image.frombytes('RGB', size, random.Random(str(size)).randbytes(size[0] * size[1] * 3)).save(content, 'WEBP', lossless=True)
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/webp')
+
+# --------------------------------------------------------------------
+
+# A replica's connection would not see the rows of the test's transaction,
+# so reads are not routed to replicas (when some are configured) here.
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, GVCRUD_REPLICAS=())
+class NaturalPersonTestCase(TestCase):
+    # A logged-in user and a few natural persons.
+    initial_rows = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tester', password='tester')
+        seed_natural_persons(cls.initial_rows, seed=1)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.person = NaturalPerson.objects.order_by('pk').first()
+
+    def form_data(self, person, **changes):
+        data = {
+            'name': person.name,
+            'email': person.email,
+            'cpf': person.cpf,
+            'gender': person.gender,
+            'birthday': person.birthday.strftime('%d/%m/%Y'),
+            'income_range': str(person.income_range).replace('.', ','),
+            'status': 'on' if person.status else '',
+            'description': person.description or '',
+        }
+        data.update(changes)
+        return data
+
+# --------------------------------------------------------------------
+
+# Query budgets: every view and form submission must cost a fixed number
+# of queries whatever the number of rows, so each request is counted
+# once, then again after more rows were added, and both counts must match
+# and stay within the budget. An N+1 or a repeated fetch breaks one or the
+# other. Caches are cleared before each count, so budgets are cold ones.
+
+class QueryBudgetTestCase(NaturalPersonTestCase):
+    growth = 60
+    # TestCase runs each test in a transaction, which turns every atomic()
+    # block into savepoints that a request in production would not send.
+    savepoint_statements = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+    def setUp(self):
+        super().setUp()
+        self.seeded = self.initial_rows
+
+    def grow(self, count=None):
+        count = count or self.growth
+        seed_natural_persons(count, start=self.seeded, seed=1)
+        self.seeded += count
+
+    def count_queries(self, send):
+        for cache in caches.all():
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = send()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 400)
+        return response, [
+            query['sql'] for query in captured.captured_queries
+            if not query['sql'].startswith(self.savepoint_statements)
+        ]
+
+    def assertQueryBudget(self, budget, send):
+        response, before = self.count_queries(send)
+        self.grow()
+        response, after = self.count_queries(send)
+        for captured in (before, after):
+            self.assertLessEqual(len(captured), budget, self.describe(captured))
+        self.assertEqual(
+            len(before), len(after),
+            f'Query count grew with the rows: {len(before)} -> {len(after)}.\n{self.describe(after)}'
+        )
+        return response
+
+    def describe(self, captured):
+        return '\n'.join(f'{index}. {sql}' for index, sql in enumerate(captured, 1))
+
+# --------------------------------------------------------------------
+
+class PageQueryBudgetTests(QueryBudgetTestCase):
+
+    def test_list(self):
+        self.assertQueryBudget(4, lambda: self.client.get(reverse('natural-list')))
+
+    def test_list_deep_page(self):
+        first = self.client.get(reverse('natural-list'), {'page_size': 2})
+        cursor = first.context['persons'].next_cursor
+        self.assertQueryBudget(4, lambda: self.client.get(reverse('natural-list'), {'page_size': 2, 'cursor': cursor}))
+
+    def test_search(self):
+        SearchEngine().has_fts_table()
+        self.assertQueryBudget(5, lambda: self.client.get(reverse('natural-list'), {'search': 'Silva'}))
+        self.assertQueryBudget(5, lambda: self.client.post(reverse('natural-list'), {'search': self.person.cpf}))
+
+    def test_detail(self):
+        self.assertQueryBudget(4, lambda: self.client.get(reverse('natural-detail', args=[self.person.pk])))
+
+    def test_detail_not_modified(self):
+        url = reverse('natural-detail', args=[self.person.pk])
+        etag = self.client.get(url)['ETag']
+        response = self.assertQueryBudget(3, lambda: self.client.get(url, HTTP_IF_NONE_MATCH=etag))
+        self.assertEqual(response.status_code, 304)
+
+    def test_reports(self):
+        self.assertQueryBudget(9, lambda: self.client.get(reverse('natural-reports')))
+
+    def test_reports_cached(self):
+        url = reverse('natural-reports')
+        self.client.get(url)
+        with self.assertNumQueries(6):
+            self.client.get(url)
+
+    def test_report_distribution(self):
+        self.assertQueryBudget(6, lambda: self.client.get(reverse('natural-report-distribution')))
+
+    def test_exports(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse('natural-export', args=['csv'])))
+        self.assertQueryBudget(5, lambda: self.client.get(reverse('natural-report-export', args=['above', 'csv'])))
+
+# --------------------------------------------------------------------
+
+class FormQueryBudgetTests(QueryBudgetTestCase):
+
+    def test_create_form(self):
+        self.assertQueryBudget(2, lambda: self.client.get(reverse('natural-create')))
+
+    def test_create(self):
+        people = generate_natural_persons(2, start=10 ** 6, seed=2)
+
+        def send():
+            person = next(people)
+            return self.client.post(reverse('natural-create'), self.form_data(person, picture=picture_upload()))
+
+        response = self.assertQueryBudget(7, send)
+        self.assertEqual(response.status_code, 302)
+
+    def test_update_form(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse('natural-update', args=[self.person.pk])))
+
+    def test_update(self):
+        url = reverse('natural-update', args=[self.person.pk])
+        response = self.assertQueryBudget(7, lambda: self.client.post(url, self.form_data(self.person, name='Edited Name')))
+        self.assertEqual(response.status_code, 302)
+
+    def test_delete(self):
+        targets = list(NaturalPerson.objects.order_by('pk').values_list('pk', flat=True)[:2])
+        response = self.assertQueryBudget(
+            12, lambda: self.client.post(reverse('natural-update', args=[targets.pop()]), {'delete': '1'})
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_anonymous_update_form_is_not_fetched(self):
+        self.client.logout()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('natural-update', args=[self.person.pk]))
+        self.assertEqual(response.status_code, 302)
+
+# --------------------------------------------------------------------
+
+class ApiClientMixin(object):
+
+    def records(self, count, start):
+        return [
+            {
+                'name': person.name, 'email': person.email, 'cpf': person.cpf, 'gender': person.gender,
+                'birthday': person.birthday.isoformat(), 'income_range': str(person.income_range),
+                'status': person.status,
+            }
+            for person in generate_natural_persons(count, start=start, seed=3)
+        ]
+
+    def send_json(self, method, url, body):
+        return getattr(self.client, method)(url, json.dumps(body), content_type='application/json')
+
+class ApiQueryBudgetTests(ApiClientMixin, QueryBudgetTestCase):
+
+    def test_list_and_detail(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse('api-natural-list')))
+        self.assertQueryBudget(3, lambda: self.client.get(reverse('api-natural-detail', args=[self.person.pk])))
+
+    def test_create_and_patch(self):
+        records = iter(self.records(2, 10 ** 6))
+        self.assertQueryBudget(7, lambda: self.send_json('post', reverse('api-natural-list'), next(records)))
+        url = reverse('api-natural-detail', args=[self.person.pk])
+        self.assertQueryBudget(5, lambda: self.send_json('patch', url, {'name': 'Patched Name'}))
+
+    def test_over_long_values(self):
+        record = dict(self.records(1, 10 ** 6)[0], email='a' * 45 + '@x.com', description='d' * 201)
+        response = self.send_json('post', reverse('api-natural-list'), record)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {
+            'email': ['E-mail cannot exceed 50 characters.'],
+            'description': ['Description cannot exceed 200 characters.'],
+        })
+
+    def test_bulk_does_not_grow_with_the_batch(self):
+        # Costs are per batch, not per record. Both batches stay under the
+        # rows SQLite accepts in one INSERT, past which Django splits it.
+        url = reverse('api-natural-bulk')
+        counts = []
+        for count, start in ((10, 10 ** 6), (100, 2 * 10 ** 6)):
+            records = self.records(count, start)
+            _, created = self.count_queries(lambda: self.send_json('post', url, records))
+            pks = list(NaturalPerson.objects.filter(email__in=[record['email'] for record in records]).values_list('pk', flat=True))
+            patch = [{'id': pk, 'income_range': '1234.56'} for pk in pks]
+            _, patched = self.count_queries(lambda: self.send_json('patch', url, patch))
+            _, deleted = self.count_queries(lambda: self.send_json('delete', url, {'ids': pks}))
+            counts.append((len(created), len(patched), len(deleted)))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[0][0], 7)
+        self.assertLessEqual(counts[0][1], 10)
+        self.assertLessEqual(counts[0][2], 7)
+
+# --------------------------------------------------------------------
+
+class ApiTests(ApiClientMixin, NaturalPersonTestCase):
+
+    def test_created_person_can_be_edited(self):
+        response = self.send_json('post', reverse('api-natural-list'), self.records(1, 10 ** 6)[0])
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(response.json()['picture'])
+        response = self.client.get(reverse('natural-update', args=[response.json()['id']]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_patch_swaps_emails(self):
+        first, second, third = NaturalPerson.objects.order_by('pk')[:3]
+        response = self.send_json('patch', reverse('api-natural-bulk'), [
+            {'id': first.pk, 'email': second.email.upper()},
+            {'id': second.pk, 'email': third.email},
+            {'id': third.pk, 'email': first.email},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [person.email for person in NaturalPerson.objects.order_by('pk')[:3]],
+            [second.email.upper(), third.email, first.email]
+        )
+
+    def test_bulk_patch_rejects_emails_kept_in_the_batch(self):
+        first, second, outsider = NaturalPerson.objects.order_by('pk')[:3]
+        response = self.send_json('patch', reverse('api-natural-bulk'), [
+            {'id': first.pk, 'email': second.email},
+            {'id': second.pk, 'name': 'Kept Email'},
+            {'id': outsider.pk, 'name': 'Outsider'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [0])
+        response = self.send_json('patch', reverse('api-natural-bulk'), [{'id': first.pk, 'email': outsider.email}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(NaturalPerson.objects.get(pk=first.pk).email, first.email)
+
+# --------------------------------------------------------------------
+
+ASYNC_VIEWS = {
+    'natural-list': views.AsyncNaturalPersonListView,
+    'natural-detail': views.AsyncNaturalPersonDetailView,
+    'natural-reports': views.AsyncNaturalPersonReportsView,
+    'natural-export': views.AsyncNaturalPersonExportView,
+    'natural-report-export': views.AsyncNaturalPersonReportExportView,
+}
+
+class AsyncUrlconf(object):
+    # The project's routes with the async views in place, as urls.py swaps
+    # them in when GVCRUD_ASYNC_VIEWS is set.
+    urlpatterns = [
+        path(str(pattern.pattern), ASYNC_VIEWS[pattern.name].as_view(), name=pattern.name)
+        if pattern.name in ASYNC_VIEWS else pattern
+        for pattern in gvcrud_urls.urlpatterns
+    ] + [
+        path('login/', views.login_auth, name='login-auth'),
+        path('logoff/', views.logoff, name='logoff'),
+    ]
+
+@override_settings(ROOT_URLCONF=AsyncUrlconf)
+class AsyncPageQueryBudgetTests(QueryBudgetTestCase):
+
+    def test_list(self):
+        response = self.assertQueryBudget(4, lambda: self.client.get(reverse('natural-list')))
+        self.assertIs(response.resolver_match.func.view_class, views.AsyncNaturalPersonListView)
+
+    def test_detail(self):
+        self.assertQueryBudget(4, lambda: self.client.get(reverse('natural-detail', args=[self.person.pk])))
+
+    def test_reports(self):
+        self.assertQueryBudget(9, lambda: self.client.get(reverse('natural-reports')))
+
+# --------------------------------------------------------------------
+
+class ExportTests(NaturalPersonTestCase):
+
+    def test_formulas_are_not_evaluated(self):
+        rows = [('=1+1', '+55 21', '-2', '@SUM(A1)', 'a=b', 7, None)]
+        exported = ''.join(stream_csv(('A', 'B', 'C', 'D', 'E', 'F', 'G'), rows))
+        self.assertEqual(exported.splitlines()[1], "'=1+1,'+55 21,'-2,'@SUM(A1),a=b,7,")
+
+    @override_settings(ROOT_URLCONF=AsyncUrlconf)
+    async def test_async_exports_stream(self):
+        await self.async_client.aforce_login(self.user)
+        count = await NaturalPerson.objects.acount()
+        response = await self.async_client.get(reverse('natural-export', args=['csv']))
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(b''.join(chunks).decode().splitlines()), count + 1)
+
+        response = await self.async_client.get(reverse('natural-report-export', args=['above', 'xlsx']))
+        self.assertTrue(response.is_async)
+        package = zipfile.ZipFile(io.BytesIO(b''.join([chunk async for chunk in response.streaming_content])))
+        sheet = package.read('xl/worksheets/sheet1.xml').decode()
+        self.assertGreater(sheet.count('<row>'), 1)
+        report = await Reports.abuild(NaturalPerson.objects.all())
+        self.assertEqual(sheet.count('<row>'), await report.get_people_above_average_income().acount() + 1)
+
+# --------------------------------------------------------------------
+
+class PerformanceMiddlewareTests(NaturalPersonTestCase):
+
+    def test_server_timing_counts_the_queries(self):
+        response = self.client.get(reverse('natural-detail', args=[self.person.pk]))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="4 queries", tpl;dur=[\d.]+$')
+
+    @override_settings(GVCRUD_METRICS_TOKEN='scrape-token')
+    def test_metrics(self):
+        metrics.reset()
+        self.client.get(reverse('natural-list'))
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('gvcrud_http_requests_total{view="natural-list",method="GET",status="200"} 1', body)
+        self.assertIn('gvcrud_db_queries_per_request_bucket{view="natural-list",le="5"} 1', body)
+
+    @override_settings(GVCRUD_METRICS_TOKEN='scrape-token')
+    def test_metrics_access(self):
+        # Not by address: a proxy on the same host sends everything from
+        # 127.0.0.1.
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='127.0.0.1').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with self.settings(GVCRUD_METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+# --------------------------------------------------------------------
+
+class ProfilingMiddlewareTests(NaturalPersonTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp(prefix='gvcrud-tests-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        profile_settings = override_settings(GVCRUD_PROFILE_DIR=directory, GVCRUD_PROFILE_KEEP=2)
+        profile_settings.enable()
+        self.addCleanup(profile_settings.disable)
+
+    def test_header_needs_a_staff_user(self):
+        url = reverse('natural-detail', args=[self.person.pk])
+        self.assertNotIn('X-Profile-Id', self.client.get(url, headers={'X-Profile': '1'}))
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, headers={'X-Profile': '1'})
+        self.assertEqual(profile_store.names(), [response['X-Profile-Id']])
+        metadata = profile_store.load(response['X-Profile-Id'])
+        self.assertEqual((metadata['view'], metadata['trigger'], metadata['status']), ('natural-detail', 'header', 200))
+        # The session and the user were loaded before profiling started.
+        self.assertEqual(metadata['sql']['count'], 2)
+        output = io.StringIO()
+        call_command('profiles', 'latest', stdout=output)
+        self.assertIn('function calls', output.getvalue())
+
+    def test_sampling_keeps_the_newest(self):
+        with override_settings(GVCRUD_PROFILE_SAMPLE_RATE=1):
+            names = [self.client.get(reverse('natural-list'))['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(profile_store.names(), names[:0:-1])
+        self.assertEqual(profile_store.load(names[-1])['trigger'], 'sample')
+
+# --------------------------------------------------------------------
+
+class ReplicaRoutingTests(NaturalPersonTestCase):
+    # "default" stands in for the replicas in requests (see
+    # NaturalPersonTestCase).
+
+    def setUp(self):
+        super().setUp()
+        replica_pool.reset()
+        self.addCleanup(replica_pool.reset)
+
+    @override_settings(GVCRUD_REPLICAS=('replica1', 'replica2'))
+    def test_round_robin(self):
+        picked = [replica_pool.acquire() for _ in range(3)]
+        self.assertEqual(picked, ['replica1', 'replica2', 'replica1'])
+        self.assertIsNone(replica_pool.acquire(pinned=True))
+
+    @override_settings(GVCRUD_REPLICAS=('replica1', 'replica2'), GVCRUD_REPLICA_SELECTION='least-loaded')
+    def test_least_loaded(self):
+        busy = replica_pool.acquire()
+        self.assertEqual(replica_pool.acquire(), 'replica2')
+        replica_pool.release('replica2')
+        self.assertEqual(replica_pool.acquire(), 'replica2')
+        replica_pool.release(busy)
+        self.assertEqual(replica_pool.acquire(), 'replica1')
+
+    def test_router(self):
+        router = ReplicaRouter()
+        state = RoutingState()
+        token = current_routing.set(state)
+        self.addCleanup(current_routing.reset, token)
+        self.assertIsNone(router.db_for_read(NaturalPerson))
+        state.database = 'replica1'
+        self.assertEqual(router.db_for_read(NaturalPerson), 'replica1')
+        self.assertIsNone(router.db_for_read(User))
+        self.assertEqual(router.db_for_write(NaturalPerson), 'default')
+        self.assertTrue(state.wrote)
+
+    @override_settings(GVCRUD_REPLICAS=('default',))
+    def test_reads_after_a_write_stay_on_the_primary(self):
+        self.client.get(reverse('natural-list'))
+        self.assertEqual(replica_pool.stats()['served'], {'default': 1})
+        url = reverse('natural-update', args=[self.person.pk])
+        response = self.client.post(url, self.form_data(self.person, name='Edited Name'))
+        self.assertIn('gvcrud_primary', response.cookies)
+        response = self.client.get(reverse('natural-list'))
+        self.assertContains(response, 'Edited Name')
+        self.assertEqual(replica_pool.stats()['primary'], 1)
+        del self.client.cookies['gvcrud_primary']
+        self.client.get(reverse('natural-reports'))
+        self.assertEqual(replica_pool.stats(), {'primary': 1, 'served': {'default': 2}, 'in_flight': {'default': 0}})
+
+# --------------------------------------------------------------------
+
+class SearchTests(NaturalPersonTestCase):
+
+    def assertFinds(self, term, expected):
+        found = SearchEngine().search(term, limit=100)
+        self.assertEqual({person.pk for person in found}, {person.pk for person in expected})
+        self.assertEqual(set(SearchEngine().queryset(term).values_list('pk', flat=True)), {person.pk for person in expected})
+
+    def test_email_contains(self):
+        domain = self.person.email.split('@')[1]
+        persons = NaturalPerson.objects.all()
+        self.assertFinds('@' + domain.upper(), [person for person in persons if person.email.lower().endswith('@' + domain)])
+        self.assertFinds(self.person.email[1:], [self.person])
+        self.assertFinds('@nowhere.invalid', [])
+
+    def test_cpf_prefix(self):
+        prefix = self.person.cpf[:4]
+        persons = NaturalPerson.objects.all()
+        self.assertFinds(prefix, [person for person in persons if person.cpf.startswith(prefix)])
+        self.assertFinds(self.person.cpf[1:], [person for person in persons if person.cpf.startswith(self.person.cpf[1:])])
+
+class SearchTriggerTests(NaturalPersonTestCase):
+
+    def test_missing_triggers_are_restored(self):
+        if not SearchEngine().has_fts_table():
+            self.skipTest('SQLite without FTS5.')
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER person_fts_ai')
+        seed_natural_persons(1, start=10 ** 6, seed=4)
+        person = NaturalPerson.objects.order_by('-pk').first()
+        self.assertNotIn(person, SearchEngine().search(person.name))
+        self.assertEqual(restore_fts_triggers(connection), ['person_fts_ai'])
+        self.assertIn(person, SearchEngine().search(person.name))
+        self.assertEqual(restore_fts_triggers(connection), [])
+
+# --------------------------------------------------------------------
+
+class CpfBatchTests(SimpleTestCase):
+
+    def test_surrounding_whitespace(self):
+        # Long enough for the numpy path, where a value one character too
+        # long used to break the digit matrix.
+        cpfs = [cpf_for(number) for number in range(CPF_VECTORIZE_FROM + 9)]
+        values = cpfs[:-1] + [cpfs[-1] + '\n']
+        mask, normalized = Validator().validate_cpf_batch(values)
+        self.assertTrue(all(mask))
+        self.assertEqual(normalized, cpfs)
+        self.assertEqual(Validator().validate_cpf(' 529.982.247-25\n'), '52998224725')
+
+    def test_malformed(self):
+        values = ['52998224725x', '5299822472\n5', '', None, '11111111111']
+        self.assertEqual(Validator().validate_cpf_batch(values * 10)[0], [False] * 50)
+
+# --------------------------------------------------------------------
+
+class ImportTests(NaturalPersonTestCase):
+
+    def import_people(self, persons, **options):
+        directory = tempfile.mkdtemp(dir=MEDIA_ROOT)
+        path = os.path.join(directory, 'people.jsonl')
+        with open(path, 'w', encoding='utf-8') as source:
+            for person in persons:
+                source.write(json.dumps({
+                    'name': person.name, 'email': person.email, 'cpf': person.cpf,
+                    'gender': person.gender, 'birthday': person.birthday.isoformat(),
+                    'income_range': str(person.income_range), 'status': person.status,
+                    'description': person.description
+                }) + '\n')
+        call_command('import_people', path, stdout=io.StringIO(), **options)
+
+    def test_person_without_picture_can_be_edited(self):
+        person = next(generate_natural_persons(1, start=10 ** 6, seed=6))
+        self.import_people([person])
+        imported = NaturalPerson.objects.get(cpf=person.cpf)
+        self.assertFalse(imported.picture)
+        response = self.client.get(reverse('natural-update', args=[imported.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'picture-form')
+
+    def test_rejected_insert_does_not_reject_later_rows(self):
+        # The first row's CPF is registered after the batch was checked, so
+        # its insert fails; the next row, with the same e-mail, is fine.
+        first, second = generate_natural_persons(2, start=10 ** 6, seed=6)
+        first.cpf = self.person.cpf
+        second.email = first.email
+        find_registered = Validator.find_registered
+        checks = []
+
+        def registered_later(validator, *args, **kwargs):
+            checks.append(kwargs)
+            if len(checks) == 1:
+                return {'email': set(), 'cpf': set()}
+            return find_registered(validator, *args, **kwargs)
+
+        with mock.patch.object(Validator, 'find_registered', autospec=True, side_effect=registered_later):
+            self.import_people([first, second], batch_size=1)
+        self.assertTrue(NaturalPerson.objects.filter(cpf=second.cpf, email=first.email).exists())
+
+    def test_duplicates_within_a_batch(self):
+        first, second = generate_natural_persons(2, start=10 ** 6, seed=6)
+        second.email = first.email.upper()
+        self.import_people([first, second])
+        self.assertTrue(NaturalPerson.objects.filter(cpf=first.cpf).exists())
+        self.assertFalse(NaturalPerson.objects.filter(cpf=second.cpf).exists())
+
+# --------------------------------------------------------------------
+
+class PictureUploadTests(NaturalPersonTestCase):
+
+    def test_large_webp(self):
+        # Past the header limit the Pillow parser gets for other formats.
+        picture = noise_webp_upload((400, 400))
+        self.assertGreater(picture.size, PictureUploadHandler.header_limit)
+        person = next(generate_natural_persons(1, start=10 ** 6, seed=5))
+        response = self.client.post(reverse('natural-create'), self.form_data(person, picture=picture))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(NaturalPerson.objects.filter(cpf=person.cpf).exists())
+
+    @override_settings(GVCRUD_PICTURE_MAX_DIMENSIONS=(300, 300))
+    def test_webp_dimensions(self):
+        person = next(generate_natural_persons(1, start=10 ** 6, seed=5))
+        response = self.client.post(reverse('natural-create'), self.form_data(person, picture=noise_webp_upload((400, 40))))
+        self.assertContains(response, 'Picture must be at most 300x300 pixels.')
+
+# --------------------------------------------------------------------
+
+class PictureReleaseTests(NaturalPersonTestCase):
+
+    def stored_picture(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.person.picture = picture_upload()
+            self.person.save()
+        storage = picture_storage()
+        name = self.person.picture.name
+        written = time.time() - 2 * 3600
+        os.utime(storage.path(name), (written, written))
+        return storage, name
+
+    def test_released_picture_is_deleted(self):
+        storage, name = self.stored_picture()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.person.delete()
+        self.assertFalse(storage.exists(name))
+
+    def test_picture_uploaded_again_is_kept(self):
+        # Another request uploads the same bytes, and its row is not
+        # committed when this one deletes the only row naming the file.
+        storage, name = self.stored_picture()
+        self.assertEqual(storage.save('person/natural/again.png', picture_upload()), name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.person.delete()
+        self.assertTrue(storage.exists(name))
+
+# --------------------------------------------------------------------
+
+class FragmentCacheTests(NaturalPersonTestCase):
+
+    def test_report_card_picks_up_its_thumbnail(self):
+        # The card cached while the thumbnail is missing shows the original,
+        # and is not served any more once the thumbnail exists.
+        with self.captureOnCommitCallbacks(execute=True), self.settings(GVCRUD_THUMBNAIL_ASYNC=False):
+            NaturalPerson.objects.update(income_range=1)
+            self.person.income_range = 10 ** 6
+            self.person.picture = picture_upload()
+            self.person.save()
+        delete_thumbnails(self.person.picture.name)
+        url = reverse('natural-reports')
+        self.assertContains(self.client.get(url), f'src="{self.person.picture.url}"')
+        generate_thumbnails(self.person.picture.name)
+        self.assertContains(self.client.get(url), f'src="{self.person.picture_thumb_url(150)}"')
+        self.assertNotEqual(self.person.picture_thumb_url(150), self.person.picture.url)
+
+# --------------------------------------------------------------------
+
+class ConditionalGetTests(NaturalPersonTestCase):
+
+    def test_list_etag_follows_the_database_version(self):
+        # Another process writing moves the version on the statistics row;
+        # nothing of this process is told.
+        url = reverse('natural-list')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        NaturalPersonStatistics.objects.filter(pk=1).update(version=F('version') + 1)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_etag_follows_the_thumbnail(self):
+        with self.captureOnCommitCallbacks(execute=True), self.settings(GVCRUD_THUMBNAIL_ASYNC=False):
+            self.person.picture = picture_upload()
+            self.person.save()
+        delete_thumbnails(self.person.picture.name)
+        url = reverse('natural-detail', args=[self.person.pk])
+        response = self.client.get(url)
+        self.assertContains(response, f'src="{self.person.picture.url}"')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        generate_thumbnails(self.person.picture.name)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response, f'src="{self.person.picture_thumb_url(400)}"')
+
+# --------------------------------------------------------------------
+
+class ReportVersionTests(NaturalPersonTestCase):
+
+    def assertVersionMoves(self, write):
+        before = NaturalPersonStatistics.get_version()
+        write()
+        self.assertGreater(NaturalPersonStatistics.get_version(), before)
+
+    def test_every_write_moves_the_version(self):
+        Reports(NaturalPerson.objects.all(), cache=report_cache)
+        self.person.description = 'Statistics stay the same.'
+        self.assertVersionMoves(self.person.save)
+        self.person.income_range += 1
+        self.assertVersionMoves(self.person.save)
+        self.assertVersionMoves(lambda: bulk_update_natural_persons([self.person], ['description']))
+        self.assertVersionMoves(lambda: bulk_create_natural_persons(generate_natural_persons(2, start=10 ** 6, seed=6)))
+        self.assertVersionMoves(self.person.delete)
+        self.assertVersionMoves(NaturalPersonStatistics.rebuild)
+
+    def test_lost_row_does_not_reuse_versions(self):
+        NaturalPersonStatistics.rebuild()
+        before = NaturalPersonStatistics.get_version()
+        NaturalPersonStatistics.objects.all().delete()
+        self.assertIsNone(report_cache.version())
+        self.person.save()
+        self.assertGreater(NaturalPersonStatistics.get_version(), before)
+
+    def test_cached_report_follows_a_write(self):
+        report = Reports(NaturalPerson.objects.all(), cache=report_cache)
+        self.assertIsNotNone(report_cache.get(f'default:{report.objects.query}', report.version))
+        self.person.income_range = report.max_income + 1
+        self.person.save()
+        self.assertEqual(Reports(NaturalPerson.objects.all(), cache=report_cache).max_income, report.max_income + 1)
+
+    def test_entries_are_kept_per_database(self):
+        objects = NaturalPerson.objects.all()
+        version = report_cache.version(objects)
+        Reports(objects, cache=report_cache).get_income_distribution()
+        self.assertIsNotNone(report_cache.get(f'default:{objects.query}', version))
+        self.assertIsNotNone(report_cache.get(f'default:{objects.query}:distribution', version))
+        self.assertIsNone(report_cache.get(f'replica1:{objects.query}', version))
+
+# --------------------------------------------------------------------
+
+class StatisticsTests(NaturalPersonTestCase):
+    # The row NaturalPersonStatistics.apply() keeps up to date must always
+    # equal what rebuild() computes from the whole table.
+    initial_rows = 20
+
+    def assertMatchesRebuild(self):
+        self.assertEqual(NaturalPersonStatistics.verify(), [])
+
+    def holder(self, field):
+        return NaturalPerson.objects.get(pk=getattr(NaturalPersonStatistics.load(), field))
+
+    def test_save_and_delete(self):
+        person = next(generate_natural_persons(1, start=10 ** 6, seed=7))
+        person.save()
+        self.assertMatchesRebuild()
+        person.income_range += 1000
+        person.gender = 'O' if person.gender != 'O' else 'F'
+        person.save()
+        self.assertMatchesRebuild()
+        person.delete()
+        self.assertMatchesRebuild()
+
+    def test_bulk(self):
+        persons = bulk_create_natural_persons(generate_natural_persons(10, start=10 ** 6, seed=7))
+        self.assertMatchesRebuild()
+        previous = [NaturalPerson(pk=person.pk, gender=person.gender, income_range=person.income_range) for person in persons]
+        for index, person in enumerate(persons):
+            person.income_range = index * 5000
+            person.gender = 'MFO'[index % 3]
+        bulk_update_natural_persons(persons, ['income_range', 'gender'], previous=previous)
+        self.assertMatchesRebuild()
+        bulk_delete_natural_persons([person.pk for person in persons[::2]])
+        self.assertMatchesRebuild()
+
+    def test_extremes(self):
+        self.holder('highest_person_id').delete()
+        self.assertMatchesRebuild()
+        self.holder('lowest_person_id').delete()
+        self.assertMatchesRebuild()
+        # The holder gets worse, and then a newer record ties with it.
+        highest = self.holder('highest_person_id')
+        highest.income_range = 0
+        highest.save()
+        self.assertMatchesRebuild()
+        tie = next(generate_natural_persons(1, start=10 ** 6, seed=7))
+        tie.income_range = self.holder('highest_person_id').income_range
+        tie.save()
+        self.assertMatchesRebuild()
+        self.assertEqual(self.holder('highest_person_id'), tie)
+
+    def test_empty(self):
+        bulk_delete_natural_persons(NaturalPerson.objects.values_list('pk', flat=True))
+        self.assertMatchesRebuild()
+        self.assertEqual(NaturalPersonStatistics.load().total_count, 0)
+
+# --------------------------------------------------------------------
+
+@override_settings(GVCRUD_INCOME_BUCKETS=(1000, 2500, 5000), GVCRUD_REPORT_PERCENTILES=(1, 25, 50, 90, 99, 100))
+class DistributionTests(NaturalPersonTestCase):
+    initial_rows = 37
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Ties across genders and at a bucket boundary.
+        for index, pk in enumerate(NaturalPerson.objects.order_by('pk').values_list('pk', flat=True)[5:17]):
+            NaturalPerson.objects.filter(pk=pk).update(income_range=(2500, 1234.5)[index % 2], gender='MFO'[index % 3])
+        NaturalPersonStatistics.rebuild()
+
+    def reference(self):
+        persons = sorted(NaturalPerson.objects.values_list('income_range', 'pk', 'gender'))
+
+        def nearest_rank(incomes, percentile):
+            return incomes[math.ceil(len(incomes) * percentile / 100) - 1] if incomes else None
+
+        def percentiles(incomes):
+            return {f'p{percentile}': nearest_rank(incomes, percentile) for percentile in (1, 25, 50, 90, 99, 100)}
+
+        incomes = [income for income, _, _ in persons]
+        genders = {}
+        for gender, _ in Validator().get_genders():
+            own = [income for income, _, other in persons if other == gender]
+            genders[gender] = {'count': len(own), 'min': min(own, default=None), 'max': max(own, default=None), 'percentiles': percentiles(own)}
+        buckets = [
+            sum(1 for income in incomes if (lower is None or income >= lower) and (upper is None or income < upper))
+            for lower, upper in ((None, 1000), (1000, 2500), (2500, 5000), (5000, None))
+        ]
+        return {'count': len(incomes), 'percentiles': percentiles(incomes), 'genders': genders, 'buckets': buckets}
+
+    def summary(self, distribution):
+        # Decimals compare by value: SQLite returns MIN/MAX with more
+        # decimal places than the column has.
+        found = distribution.as_dict()
+
+        def number(value):
+            return None if value is None else Decimal(value)
+
+        def percentiles(values):
+            return {rank: number(value) for rank, value in values.items()}
+
+        return {
+            'count': found['count'],
+            'percentiles': percentiles(found['percentiles']),
+            'genders': {
+                gender: {
+                    'count': item['count'], 'min': number(item['min']), 'max': number(item['max']),
+                    'percentiles': percentiles(item['percentiles'])
+                }
+                for gender, item in found['genders'].items()
+            },
+            'buckets': [bucket['count'] for bucket in found['buckets']],
+        }
+
+    def assertMatchesReference(self):
+        expected = self.reference()
+        with self.subTest('window functions'):
+            self.assertTrue(connection.features.supports_over_clause)
+            self.assertEqual(self.summary(ReportEngine().distribution(NaturalPerson.objects.all())), expected)
+        with self.subTest('streaming'), mock.patch.object(connection.features, 'supports_over_clause', False):
+            self.assertEqual(self.summary(ReportEngine().distribution(NaturalPerson.objects.all())), expected)
+
+    def test_matches_reference(self):
+        self.assertMatchesReference()
+
+    def test_one_gender_and_single_rows(self):
+        NaturalPerson.objects.exclude(pk=self.person.pk).update(gender='F')
+        NaturalPerson.objects.filter(pk=self.person.pk).update(gender='O')
+        NaturalPersonStatistics.rebuild()
+        self.assertMatchesReference()
+
+    def test_empty(self):
+        bulk_delete_natural_persons(NaturalPerson.objects.values_list('pk', flat=True))
+        self.assertMatchesReference()
+
+    def test_public_like_the_report_page(self):
+        self.client.logout()
+        response = self.client.get(reverse('natural-report-distribution'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], NaturalPerson.objects.count())
+
+# --------------------------------------------------------------------
+
+class KeysetPaginationTests(NaturalPersonTestCase):
+    initial_rows = 23
+
+    def setUp(self):
+        super().setUp()
+        # Most rows share their created_at, so only the id tells them apart.
+        tied = NaturalPerson.objects.order_by('pk').values_list('pk', flat=True)[3:18]
+        created_at = NaturalPerson.objects.order_by('created_at').values_list('created_at', flat=True).first()
+        NaturalPerson.objects.filter(pk__in=list(tied)).update(created_at=created_at)
+        self.expected = list(NaturalPerson.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        self.paginator = KeysetPaginator(NaturalPerson.objects.all(), per_page=5)
+
+    def ids(self, pages):
+        return [[person.pk for person in page] for page in pages]
+
+    def test_walk_forward_and_back(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+        self.assertEqual([pk for page in self.ids(pages) for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertFalse(pages[0].has_previous())
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(self.paginator.page(back[-1].previous_cursor))
+        self.assertEqual(self.ids(back[::-1]), self.ids(pages))
+
+    def test_tampered_cursors(self):
+        first = self.ids([self.paginator.page()])
+        created_at = NaturalPerson.objects.values_list('created_at', flat=True).first().isoformat()
+        payloads = (
+            ['sideways', [created_at, 1]],
+            ['next', ['not a date', 1]],
+            ['next', [created_at, 'x']],
+            ['next', [created_at]],
+            ['next', 5],
+            'next',
+        )
+        cursors = ['garbage!', '', 'e30'] + [
+            base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=') for payload in payloads
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.ids([self.paginator.page(cursor)]), first)
+        response = self.client.get(reverse('natural-list'), {'cursor': 'garbage!', 'page_size': 5})
+        self.assertEqual([person.pk for person in response.context['persons']], first[0])
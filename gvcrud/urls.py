@@ -1,17 +1,32 @@
 from django.urls import path
 from django.conf.urls.static import static
 from django.conf import settings
-from .views import NaturalPersonListView, NaturalPersonCreateView, NaturalPersonDetailView, NaturalPersonUpdateView, NaturalPersonReportsView
+from .views import NaturalPersonListView, NaturalPersonCreateView, NaturalPersonDetailView, NaturalPersonUpdateView, NaturalPersonReportsView, NaturalPersonExportView, NaturalPersonReportExportView, NaturalPersonDistributionView
+from .views import AsyncNaturalPersonListView, AsyncNaturalPersonDetailView, AsyncNaturalPersonReportsView, AsyncNaturalPersonExportView, AsyncNaturalPersonReportExportView
+from .api import NaturalPersonListApi, NaturalPersonDetailApi, NaturalPersonBulkApi
 from . import views
 
+if getattr(settings, 'GVCRUD_ASYNC_VIEWS', False):
+    NaturalPersonListView = AsyncNaturalPersonListView
+    NaturalPersonDetailView = AsyncNaturalPersonDetailView
+    NaturalPersonReportsView = AsyncNaturalPersonReportsView
+    NaturalPersonExportView = AsyncNaturalPersonExportView
+    NaturalPersonReportExportView = AsyncNaturalPersonReportExportView
+
 urlpatterns = [
     path('', views.home, name='home-person'),
     path('choice/', views.choice_person, name='person-choice'),
     path('natural/', NaturalPersonListView.as_view(), name='natural-list'),
     path('natural/create', NaturalPersonCreateView.as_view(), name='natural-create'),
+    path('natural/export.<str:fmt>', NaturalPersonExportView.as_view(), name='natural-export'),
     path('natural/reports', NaturalPersonReportsView.as_view(), name='natural-reports'),
+    path('natural/reports/distribution.json', NaturalPersonDistributionView.as_view(), name='natural-report-distribution'),
+    path('natural/reports/export/<str:bucket>.<str:fmt>', NaturalPersonReportExportView.as_view(), name='natural-report-export'),
     path('natural/<int:pk>', NaturalPersonDetailView.as_view(), name='natural-detail'),
     path('natural/<int:pk>/edit', NaturalPersonUpdateView.as_view(), name='natural-update'),
+    path('api/natural/', NaturalPersonListApi.as_view(), name='api-natural-list'),
+    path('api/natural/bulk', NaturalPersonBulkApi.as_view(), name='api-natural-bulk'),
+    path('api/natural/<int:pk>', NaturalPersonDetailApi.as_view(), name='api-natural-detail'),
 ] 
 
 if settings.DEBUG:
@@ -0,0 +1,103 @@
+from django.db import connection, transaction
+# --------------------------------------------------------------------
+
+def bulk_create_natural_persons(persons, batch_size=1000):
+    # bulk_create() refuses multi-table inheritance, so the person rows go
+    # in through bulk_create() (which hands back their ids on SQLite and
+    # PostgreSQL) and the natural_person rows through one executemany().
+    # Signals are not sent, so the statistics (and with them the version
+    # report results are keyed on) are updated here.
+    from ..models import Person, NaturalPerson, NaturalPersonStatistics
+    persons = list(persons)
+    if not persons:
+        return persons
+    parent_fields = [field.attname for field in Person._meta.concrete_fields if not field.primary_key]
+    child_fields = [field for field in NaturalPerson._meta.local_concrete_fields if not field.primary_key]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(NaturalPerson._meta.db_table),
+        ', '.join(quote(column) for column in ['person_ptr_id'] + [field.column for field in child_fields]),
+        ', '.join(['%s'] * (len(child_fields) + 1))
+    )
+    with transaction.atomic():
+        parents = Person.objects.bulk_create(
+            [Person(**{field: getattr(person, field) for field in parent_fields}) for person in persons],
+            batch_size=batch_size
+        )
+        for person, parent in zip(persons, parents):
+            person.person_ptr_id = parent.pk
+            person.id = parent.pk
+            person.created_at = parent.created_at
+            person.updated_at = parent.updated_at
+            person._state.adding = False
+            person._state.db = parent._state.db
+        with connection.cursor() as cursor:
+            for start in range(0, len(persons), batch_size):
+                cursor.executemany(sql, [
+                    [person.pk] + [field.get_db_prep_save(getattr(person, field.attname), connection) for field in child_fields]
+                    for person in persons[start:start + batch_size]
+                ])
+        NaturalPersonStatistics.apply(added=persons)
+    return persons
+
+def bulk_update_natural_persons(persons, fields, previous=(), batch_size=1000):
+    # previous holds the persons as they were before the change (at least
+    # pk, gender and income_range), so the statistics move by the same
+    # deltas a save() per row would have applied.
+    from django.db.models import CharField, Value
+    from django.db.models.functions import Cast, Concat
+    from django.utils import timezone
+    from ..models import Person, NaturalPerson, NaturalPersonStatistics
+    persons = list(persons)
+    if not persons or not fields:
+        return persons
+    now = timezone.now()
+    for person in persons:
+        person.updated_at = now
+    fields = list(dict.fromkeys(list(fields) + ['updated_at']))
+    with transaction.atomic():
+        if 'email' in fields:
+            # The unique e-mail index is checked row by row (SQLite, and
+            # PostgreSQL unless deferred), so persons swapping e-mails would
+            # collide half-way through one UPDATE. Their e-mails are parked
+            # first on "#<pk>", which is unique and never a valid e-mail.
+            Person.objects.filter(pk__in=[person.pk for person in persons]).update(
+                email=Concat(Value('#'), Cast('pk', CharField()), output_field=CharField())
+            )
+        NaturalPerson.objects.bulk_update(persons, fields, batch_size=batch_size)
+        if {'gender', 'income_range'} & set(fields):
+            NaturalPersonStatistics.apply(removed=list(previous), added=persons)
+        else:
+            NaturalPersonStatistics.touch()
+    return persons
+
+def bulk_delete_natural_persons(pks, batch_size=1000):
+    # A queryset delete() would send post_delete per row, and each of those
+    # updates the statistics row; here both tables are cleared with one
+    # DELETE per batch and the statistics are moved once.
+    from ..models import Person, NaturalPerson, NaturalPersonStatistics
+    from .storage import release_pictures
+    pks = list(dict.fromkeys(pks))
+    if not pks:
+        return []
+    quote = connection.ops.quote_name
+    with transaction.atomic():
+        persons = list(
+            NaturalPerson.objects.filter(pk__in=pks).only('pk', 'gender', 'income_range', 'picture')
+        )
+        found = [person.pk for person in persons]
+        with connection.cursor() as cursor:
+            for start in range(0, len(found), batch_size):
+                batch = found[start:start + batch_size]
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    f'DELETE FROM {quote(NaturalPerson._meta.db_table)} WHERE {quote("person_ptr_id")} IN ({placeholders})',
+                    batch
+                )
+                cursor.execute(
+                    f'DELETE FROM {quote(Person._meta.db_table)} WHERE {quote(Person._meta.pk.column)} IN ({placeholders})',
+                    batch
+                )
+        NaturalPersonStatistics.apply(removed=persons)
+        release_pictures([person.picture.name for person in persons if person.picture])
+    return found
@@ -0,0 +1,82 @@
+import hashlib
+import threading
+from django.conf import settings
+from django.core.cache import caches
+
+# --------------------------------------------------------------------
+
+class ReportCache(object):
+    # Entries are keyed on the version of the statistics row, read from the
+    # database the report is computed from. Every write moves it when it
+    # commits, so no process (or worker sharing the backend) can read an
+    # entry computed before a write it has seen. Without a shared backend
+    # each process only computes its own copies.
+    key_prefix = 'gvcrud:report'
+
+    def __init__(self, alias=None, timeout=None):
+        self.__alias = alias
+        self.__timeout = timeout
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.__alias or getattr(settings, 'GVCRUD_REPORT_CACHE', 'default')]
+
+    @property
+    def timeout(self):
+        if self.__timeout is not None:
+            return self.__timeout
+        return getattr(settings, 'GVCRUD_REPORT_CACHE_TTL', 300)
+
+    def version(self, objects=None):
+        from ..models import NaturalPersonStatistics
+        return NaturalPersonStatistics.get_version(using=objects.db if objects is not None else None)
+
+    async def aversion(self, objects=None):
+        from ..models import NaturalPersonStatistics
+        return await NaturalPersonStatistics.aget_version(using=objects.db if objects is not None else None)
+
+    def __key(self, key, version):
+        digest = hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+        return f'{self.key_prefix}:{version}:{digest}'
+
+    def get(self, key, version):
+        # No version (the statistics row is still missing): nothing is read
+        # or kept.
+        if version is None:
+            return None
+        value = self.backend.get(self.__key(key, version))
+        self.__count(value)
+        return value
+
+    def __count(self, value):
+        with self.__lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+    async def aget(self, key, version):
+        if version is None:
+            return None
+        value = await self.backend.aget(self.__key(key, version))
+        self.__count(value)
+        return value
+
+    def set(self, key, version, value):
+        if version is not None:
+            self.backend.set(self.__key(key, version), value, timeout=self.timeout)
+
+    async def aset(self, key, version, value):
+        if version is not None:
+            await self.backend.aset(self.__key(key, version), value, timeout=self.timeout)
+
+    def stats(self):
+        with self.__lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+report_cache = ReportCache()
+
+# --------------------------------------------------------------------
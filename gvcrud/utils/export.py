@@ -0,0 +1,148 @@
+import csv
+import zipfile
+from asgiref.sync import sync_to_async
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+# --------------------------------------------------------------------
+
+class StreamBuffer(object):
+    # Write-only file object: whatever csv/zipfile write is collected here
+    # and handed to the response by the generators below. It has no tell()
+    # or seek(), which makes zipfile write in streaming mode.
+
+    def __init__(self):
+        self.__chunks = []
+
+    def write(self, data):
+        self.__chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.__chunks = self.__chunks, []
+        return chunks
+
+# --------------------------------------------------------------------
+
+# Spreadsheet applications evaluate a CSV cell starting with one of these
+# as a formula; a leading apostrophe makes them show it as text instead.
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def _csv_value(value):
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def stream_csv(header, rows, flush_every=500):
+    buffer = StreamBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for index, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(value) for value in row])
+        if index % flush_every == 0:
+            yield ''.join(buffer.drain())
+    yield ''.join(buffer.drain())
+
+# --------------------------------------------------------------------
+
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c><v>{value}</v></c>'
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+def _xlsx_row(row):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>'
+
+def stream_xlsx(header, rows, sheet_name='Sheet1', flush_every=500):
+    # A minimal SpreadsheetML package written straight into the response.
+    # Rows use inline strings, so nothing has to be kept in memory until
+    # the end the way a shared-strings table would require. Those are never
+    # evaluated (a formula needs an <f> element), so no escaping as in CSV.
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as package:
+        package.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        package.writestr('_rels/.rels', XLSX_ROOT_RELS)
+        package.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(name=escape(sheet_name[:31])))
+        package.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        yield b''.join(buffer.drain())
+        with package.open('xl/worksheets/sheet1.xml', mode='w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(header).encode())
+            for index, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row(row).encode())
+                if index % flush_every == 0:
+                    yield b''.join(buffer.drain())
+            sheet.write(b'</sheetData></worksheet>')
+    yield b''.join(buffer.drain())
+
+# --------------------------------------------------------------------
+
+async def astream(chunks):
+    # For async views: StreamingHttpResponse reads a sync iterator under
+    # ASGI by buffering all of it first. This advances the generator one
+    # chunk (flush_every rows) at a time on the thread-sensitive executor,
+    # where the ORM reading the rows has to run anyway.
+    advance = sync_to_async(next)
+    done = object()
+    while True:
+        chunk = await advance(chunks, done)
+        if chunk is done:
+            return
+        yield chunk
+
+# --------------------------------------------------------------------
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
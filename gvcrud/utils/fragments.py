@@ -0,0 +1,80 @@
+import hashlib
+import threading
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.safestring import mark_safe
+
+# --------------------------------------------------------------------
+
+class FragmentCache(object):
+    # Rendered HTML of one person (a table row, a report card), keyed by the
+    # template, the person's pk and the time it was last written. Any save
+    # moves updated_at, so an edited person simply misses and is rendered
+    # again; stale entries are never read and expire on their own.
+    key_prefix = 'gvcrud:fragment'
+
+    def __init__(self, alias=None, timeout=None):
+        self.__alias = alias
+        self.__timeout = timeout
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def backend(self):
+        return caches[self.__alias or getattr(settings, 'GVCRUD_FRAGMENT_CACHE', 'fragments')]
+
+    @property
+    def timeout(self):
+        if self.__timeout is not None:
+            return self.__timeout
+        return getattr(settings, 'GVCRUD_FRAGMENT_CACHE_TTL', 600)
+
+    def stamp(self, row):
+        if isinstance(row, dict):
+            return row.get('updated_at') or row.get('created_at')
+        return getattr(row, 'updated_at', None) or getattr(row, 'created_at', None)
+
+    def key(self, template_name, row, extra=None):
+        stamp = self.stamp(row)
+        pk = row['id'] if isinstance(row, dict) else row.pk
+        if stamp is None or pk is None:
+            return None
+        variant = repr(sorted((extra or {}).items()))
+        raw = ':'.join((
+            str(getattr(settings, 'GVCRUD_FRAGMENT_VERSION', 1)), template_name,
+            translation.get_language() or '', variant, str(pk), stamp.isoformat()
+        ))
+        return f'{self.key_prefix}:{hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()}'
+
+    def render_many(self, template_name, rows, extra=None):
+        # One get_many for the whole page; only the misses are rendered, and
+        # they are stored back with a single set_many.
+        rows = list(rows)
+        keys = [self.key(template_name, row, extra) for row in rows]
+        cached = self.backend.get_many([key for key in keys if key is not None])
+        rendered = {}
+        parts = []
+        for key, row in zip(keys, rows):
+            html = cached.get(key) if key is not None else None
+            if html is None:
+                html = render_to_string(template_name, {**(extra or {}), 'person': row})
+                if key is not None:
+                    rendered[key] = html
+            parts.append(html)
+        if rendered:
+            self.backend.set_many(rendered, timeout=self.timeout)
+        with self.__lock:
+            self.hits += len(cached)
+            self.misses += len(rows) - len(cached)
+        return mark_safe(''.join(parts))
+
+    def stats(self):
+        with self.__lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+fragment_cache = FragmentCache()
+
+# --------------------------------------------------------------------
@@ -0,0 +1,178 @@
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+# --------------------------------------------------------------------
+
+class RequestTimings(object):
+    # What one request spent in SQL and in templates. It lives in a context
+    # variable, which sync_to_async copies into its worker thread, so the
+    # queries of async views are counted too.
+    __slots__ = ('sql_count', 'sql_time', 'template_time', 'rendering', 'queries')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+        # (sql, seconds) of each query, kept only while profiling.
+        self.queries = None
+
+current_timings = ContextVar('gvcrud_request_timings', default=None)
+
+def record_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        timings.sql_time += elapsed
+        timings.sql_count += 1
+        if timings.queries is not None:
+            timings.queries.append((sql, elapsed))
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Installed once per connection rather than around each request, since
+    # the queries of async views run on connections of another thread.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+# --------------------------------------------------------------------
+
+class TimedTemplate(object):
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        timings = current_timings.get()
+        # Fragments rendered inside a page are part of the page's time.
+        if timings is None or timings.rendering:
+            return self.template.render(context, request)
+        timings.rendering = True
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            timings.template_time += time.perf_counter() - started
+            timings.rendering = False
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # The Django template backend, timing each top-level render for the
+    # request being measured by PerformanceMiddleware.
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+# --------------------------------------------------------------------
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+class Histogram(object):
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+class MetricsRegistry(object):
+    # Request counters and histograms by view, in this process. With several
+    # worker processes each one keeps its own, as prometheus_client does
+    # without its multiprocess mode; scrape every worker or run one.
+
+    histograms = (
+        ('gvcrud_http_request_duration_seconds', 'Time to produce the response.', 'duration'),
+        ('gvcrud_db_query_duration_seconds', 'Time spent in SQL per request.', 'sql_time'),
+        ('gvcrud_db_queries_per_request', 'SQL queries per request.', 'sql_count'),
+        ('gvcrud_template_render_duration_seconds', 'Time spent rendering templates per request.', 'template_time'),
+    )
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.__lock:
+            self.requests = {}
+            self.series = {name: {} for name, _, _ in self.histograms}
+
+    def get_duration_buckets(self):
+        return tuple(getattr(settings, 'GVCRUD_METRICS_BUCKETS', DURATION_BUCKETS))
+
+    def observe(self, view, method, status, duration, timings):
+        values = {
+            'duration': duration,
+            'sql_time': timings.sql_time,
+            'sql_count': timings.sql_count,
+            'template_time': timings.template_time,
+        }
+        with self.__lock:
+            key = (view, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, _, field in self.histograms:
+                series = self.series[name]
+                if view not in series:
+                    bounds = QUERY_COUNT_BUCKETS if field == 'sql_count' else self.get_duration_buckets()
+                    series[view] = Histogram(bounds)
+                series[view].observe(values[field])
+
+    def render(self):
+        # Prometheus text exposition format, version 0.0.4.
+        with self.__lock:
+            lines = [
+                '# HELP gvcrud_http_requests_total Requests answered, by view, method and status.',
+                '# TYPE gvcrud_http_requests_total counter',
+            ]
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'gvcrud_http_requests_total{labels(view=view, method=method, status=status)} {count}')
+            for name, help_text, _ in self.histograms:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, histogram in sorted(self.series[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{labels(view=view, le=format_value(bound))} {cumulative}')
+                    lines.append(f'{name}_bucket{labels(view=view, le="+Inf")} {histogram.count}')
+                    lines.append(f'{name}_sum{labels(view=view)} {format_value(histogram.total)}')
+                    lines.append(f'{name}_count{labels(view=view)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+def labels(**values):
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in values.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+metrics = MetricsRegistry()
+
+# --------------------------------------------------------------------
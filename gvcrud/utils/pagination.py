@@ -0,0 +1,123 @@
+import base64
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# --------------------------------------------------------------------
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+# --------------------------------------------------------------------
+
+class KeysetPaginator(object):
+    # Pages through a queryset ordered by (created_at, id), newest first,
+    # the same order as the NaturalPerson model. Each page seeks from the
+    # key of the last row seen instead of using OFFSET, so page 10,000
+    # costs the same index range scan as page 1.
+
+    fields = ('created_at', 'id')
+
+    def __init__(self, objects, per_page=None):
+        self.objects = objects
+        self.per_page = per_page or get_page_size()
+
+    def __value(self, row, field):
+        return row[field] if isinstance(row, dict) else getattr(row, field)
+
+    def encode_cursor(self, row, direction):
+        key = [self.__value(row, field) for field in self.fields]
+        payload = json.dumps([direction, [value.isoformat() if hasattr(value, 'isoformat') else value for value in key]])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, key = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            if direction not in ('next', 'prev') or len(key) != len(self.fields):
+                return None
+            model = self.objects.model
+            return direction, [
+                model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, key)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            return None
+
+    def __seek(self, key, direction):
+        created_at, pk = key
+        if direction == 'next':
+            return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+
+    def __query(self, cursor):
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            return None, self.objects.order_by('-created_at', '-id')[:self.per_page + 1]
+        direction, key = decoded
+        if direction == 'next':
+            return direction, self.objects.filter(self.__seek(key, 'next')).order_by('-created_at', '-id')[:self.per_page + 1]
+        return direction, self.objects.filter(self.__seek(key, 'prev')).order_by('created_at', 'id')[:self.per_page + 1]
+
+    def __build_page(self, direction, rows):
+        has_more = len(rows) > self.per_page
+        if direction is None:
+            rows = rows[:self.per_page]
+            return KeysetPage(
+                rows,
+                next_cursor=self.encode_cursor(rows[-1], 'next') if has_more else None
+            )
+        if direction == 'next':
+            rows = rows[:self.per_page]
+            return KeysetPage(
+                rows,
+                next_cursor=self.encode_cursor(rows[-1], 'next') if has_more else None,
+                previous_cursor=self.encode_cursor(rows[0], 'prev') if rows else None
+            )
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], 'next') if rows else None,
+            previous_cursor=self.encode_cursor(rows[0], 'prev') if has_more else None
+        )
+
+    def page(self, cursor=None):
+        direction, query = self.__query(cursor)
+        return self.__build_page(direction, list(query))
+
+    async def apage(self, cursor=None):
+        direction, query = self.__query(cursor)
+        return self.__build_page(direction, [row async for row in query])
+
+# --------------------------------------------------------------------
+
+def get_page_size(requested=None):
+    default = getattr(settings, 'GVCRUD_PAGE_SIZE', 20)
+    maximum = getattr(settings, 'GVCRUD_MAX_PAGE_SIZE', 100)
+    try:
+        size = int(requested) if requested else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, maximum))
@@ -0,0 +1,122 @@
+import cProfile
+import json
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from django.conf import settings
+
+# --------------------------------------------------------------------
+
+# cProfile hooks the interpreter as a whole (sys.monitoring since Python
+# 3.12), so only one request is profiled at a time; requests arriving while
+# one is running are served unprofiled. The profile also covers the
+# sync_to_async threads of async views, and whatever else runs meanwhile.
+profiling_lock = threading.Lock()
+
+def start_profiler():
+    if not profiling_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler (a debugger, coverage) holds the hook.
+        profiling_lock.release()
+        return None
+    return profiler
+
+def stop_profiler(profiler):
+    try:
+        profiler.disable()
+    finally:
+        profiling_lock.release()
+
+def summarize_queries(queries, limit=10):
+    repeated = {}
+    for sql, elapsed in queries:
+        count, total = repeated.get(sql, (0, 0.0))
+        repeated[sql] = (count + 1, total + elapsed)
+    return {
+        'count': len(queries),
+        'ms': round(sum(elapsed for _, elapsed in queries) * 1000, 3),
+        'slowest': [
+            {'sql': sql, 'ms': round(elapsed * 1000, 3)}
+            for sql, elapsed in sorted(queries, key=lambda query: query[1], reverse=True)[:limit]
+        ],
+        'repeated': [
+            {'sql': sql, 'count': count, 'ms': round(total * 1000, 3)}
+            for sql, (count, total) in sorted(repeated.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+            if count > 1
+        ],
+    }
+
+# --------------------------------------------------------------------
+
+class ProfileStore(object):
+    # A directory of <name>.prof (pstats) files, each with a <name>.json
+    # holding the request, its timings and its SQL summary. Only the newest
+    # GVCRUD_PROFILE_KEEP profiles are kept.
+
+    def __init__(self, directory=None, keep=None):
+        self.__directory = directory
+        self.__keep = keep
+
+    @property
+    def directory(self):
+        if self.__directory is not None:
+            return self.__directory
+        return getattr(settings, 'GVCRUD_PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+    @property
+    def keep(self):
+        if self.__keep is not None:
+            return self.__keep
+        return getattr(settings, 'GVCRUD_PROFILE_KEEP', 100)
+
+    def make_name(self, view):
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%f')
+        return f"{stamp}-{re.sub(r'[^A-Za-z0-9_]+', '-', view).strip('-') or 'view'}"
+
+    def save(self, profiler, metadata):
+        os.makedirs(self.directory, exist_ok=True)
+        name = self.make_name(metadata['view'])
+        profiler.dump_stats(self.stats_path(name))
+        with open(os.path.join(self.directory, f'{name}.json'), 'w', encoding='utf-8') as output:
+            json.dump(dict(metadata, name=name), output, indent=2)
+        self.rotate()
+        return name
+
+    def stats_path(self, name):
+        return os.path.join(self.directory, f'{name}.prof')
+
+    def names(self):
+        # Newest first; the timestamp prefix makes that the reverse name order.
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((entry[:-5] for entry in os.listdir(self.directory) if entry.endswith('.json')), reverse=True)
+
+    def rotate(self):
+        for name in self.names()[self.keep:]:
+            for extension in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, name + extension))
+                except FileNotFoundError:
+                    pass
+
+    def load(self, name):
+        with open(os.path.join(self.directory, f'{name}.json'), encoding='utf-8') as source:
+            return json.load(source)
+
+    def find(self, prefix):
+        # "latest", a whole name or any unambiguous prefix of one.
+        names = self.names()
+        if prefix == 'latest':
+            return names[:1]
+        if prefix in names:
+            return [prefix]
+        return [name for name in names if name.startswith(prefix)]
+
+profile_store = ProfileStore()
+
+# --------------------------------------------------------------------
@@ -0,0 +1,95 @@
+import re
+from datetime import date, datetime
+from django.core.exceptions import ValidationError
+# --------------------------------------------------------------------
+from .validator import Validator
+# --------------------------------------------------------------------
+
+# Validation of natural person records that arrive as plain values (import
+# files, the JSON API) rather than through NaturalPersonForm. The rules are
+# the Validator's; this only adapts machine formats to what it expects.
+
+BIRTHDAY_FORMATS = ('%d/%m/%Y', '%Y-%m-%d')
+
+RECORD_FIELDS = ('name', 'email', 'cpf', 'gender', 'birthday', 'income_range', 'status', 'description')
+
+def text(value):
+    if value is None:
+        return ''
+    return str(value)
+
+def parse_birthday(value):
+    if isinstance(value, date):
+        return value
+    value = text(value)
+    for birthday_format in BIRTHDAY_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), birthday_format).date()
+        except ValueError:
+            continue
+    if value.strip():
+        raise ValidationError('Invalid birthday.')
+    return None
+
+def parse_income(value):
+    # Machine exports write "1234.56"; the form expects "1.234,56".
+    value = text(value).strip()
+    if re.fullmatch(r'\d+\.\d{1,2}', value):
+        whole, cents = value.split('.')
+        return f'{whole},{cents.ljust(2, "0")}'
+    if re.fullmatch(r'\d+', value):
+        return f'{value},00'
+    return value
+
+def parse_status(value):
+    if isinstance(value, bool):
+        return value
+    value = text(value).strip().lower()
+    if value in ('1', 'true', 'yes', 'y', 't'):
+        return True
+    if value in ('0', 'false', 'no', 'n', 'f'):
+        return False
+    return None
+
+def checked_cpf(value, cpf_ok, cpf):
+    # The whole batch went through Validator.validate_cpf_batch already.
+    if not text(value).strip():
+        raise ValidationError('CPF is empty.')
+    if not cpf_ok:
+        raise ValidationError('Invalid CPF.')
+    return cpf
+
+def check_length(field, value):
+    # The column limits, which PostgreSQL enforces with a DataError rather
+    # than the IntegrityError callers turn into a per-record error.
+    from ..models import NaturalPerson
+    model_field = NaturalPerson._meta.get_field(field)
+    if isinstance(value, str) and model_field.max_length and len(value) > model_field.max_length:
+        raise ValidationError(f'{model_field.verbose_name} cannot exceed {model_field.max_length} characters.')
+    return value
+
+def validate_record(row, fields=RECORD_FIELDS, cpf_check=None):
+    # Returns (values, errors), errors mapping each field to its messages.
+    # cpf_check is (valid, normalized) from validate_cpf_batch, so callers
+    # validating many rows check every CPF in one vectorised pass.
+    validator = Validator()
+    checks = {
+        'name': lambda value: validator.validate_name(text(value)),
+        'email': lambda value: validator.validate_email_format(text(value)).strip(),
+        'cpf': lambda value: (
+            checked_cpf(value, *cpf_check) if cpf_check is not None else validator.validate_cpf(text(value))
+        ),
+        'gender': lambda value: validator.validate_gender(text(value)),
+        'birthday': lambda value: validator.validate_birthday(parse_birthday(value)),
+        'income_range': lambda value: validator.validate_income_range(parse_income(value)),
+        'status': lambda value: validator.validate_status(parse_status(value)),
+        'description': lambda value: text(value) or None,
+    }
+    values = {}
+    errors = {}
+    for field in fields:
+        try:
+            values[field] = check_length(field, checks[field](row.get(field)))
+        except ValidationError as error:
+            errors[field] = error.messages
+    return values, errors
@@ -0,0 +1,114 @@
+import itertools
+import threading
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# --------------------------------------------------------------------
+
+class RoutingState(object):
+    # Where the current request reads from. ReplicaMiddleware creates it
+    # (pinned when the client wrote recently), the read-only views set
+    # database to a replica for as long as they run, and the router notes
+    # any write so the middleware can pin the client's next requests. Like
+    # RequestTimings it lives in a context variable, so it follows async
+    # views into their sync_to_async threads.
+    __slots__ = ('pinned', 'database', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.database = None
+        self.wrote = False
+
+current_routing = ContextVar('gvcrud_database_routing', default=None)
+
+def get_routed_apps():
+    return tuple(getattr(settings, 'GVCRUD_REPLICA_APPS', ('gvcrud',)))
+
+# --------------------------------------------------------------------
+
+class ReplicaPool(object):
+    # Picks the replica a read-only request goes to, among the aliases in
+    # GVCRUD_REPLICAS: in turn ("round-robin") or the one serving the fewest
+    # requests of this process right now ("least-loaded"). No replicas
+    # configured means every read stays on the primary.
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__turn = itertools.count()
+        self.__in_flight = {}
+        self.__served = {}
+        self.__primary = 0
+
+    @property
+    def aliases(self):
+        return tuple(getattr(settings, 'GVCRUD_REPLICAS', ()))
+
+    @property
+    def selection(self):
+        return getattr(settings, 'GVCRUD_REPLICA_SELECTION', 'round-robin')
+
+    def acquire(self, pinned=False):
+        aliases = self.aliases
+        with self.__lock:
+            if pinned or not aliases:
+                self.__primary += 1
+                return None
+            if self.selection == 'least-loaded':
+                # Ties go to the replica that has served the fewest so far,
+                # so an idle pool still spreads its requests.
+                alias = min(aliases, key=lambda alias: (self.__in_flight.get(alias, 0), self.__served.get(alias, 0)))
+            else:
+                alias = aliases[next(self.__turn) % len(aliases)]
+            self.__in_flight[alias] = self.__in_flight.get(alias, 0) + 1
+            self.__served[alias] = self.__served.get(alias, 0) + 1
+        return alias
+
+    def release(self, alias):
+        if alias is None:
+            return
+        with self.__lock:
+            self.__in_flight[alias] -= 1
+
+    def stats(self):
+        with self.__lock:
+            return {'primary': self.__primary, 'served': dict(self.__served), 'in_flight': dict(self.__in_flight)}
+
+    def reset(self):
+        with self.__lock:
+            self.__turn = itertools.count()
+            self.__in_flight = {}
+            self.__served = {}
+            self.__primary = 0
+
+replica_pool = ReplicaPool()
+
+# --------------------------------------------------------------------
+
+class ReplicaRouter(object):
+    # Sends reads of the routed apps to the replica chosen for the request,
+    # and everything else, writes included, to the primary. Outside a
+    # read-only view (forms, the API, the admin, management commands) the
+    # state holds no replica and reads stay on the primary too.
+
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        if state is None or state.database is None or model._meta.app_label not in get_routed_apps():
+            return None
+        return state.database
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None and model._meta.app_label in get_routed_apps():
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's rows, so objects read from any of them
+        # may be related to each other.
+        databases = {DEFAULT_DB_ALIAS, *replica_pool.aliases}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+# --------------------------------------------------------------------
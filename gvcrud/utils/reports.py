@@ -1,24 +1,419 @@
-from django.db.models import Max, Min, Avg, Count, Sum, Q
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min, Avg, Count, Sum, Case, When, Q, F, Window, IntegerField, ExpressionWrapper
+from django.db.models.functions import RowNumber
+from .validator import Validator
 
-class Reports:
+# --------------------------------------------------------------------
+
+class ReportSnapshot(object):
+    __slots__ = (
+        'count', 'total_income', 'max_income', 'min_income', 'avg_income',
+        'gender_counts', 'highest_person', 'lowest_person'
+    )
+
+    def __init__(self, **kwargs):
+        for field in self.__slots__:
+            object.__setattr__(self, field, kwargs.get(field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ReportSnapshot is immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('ReportSnapshot is immutable.')
+
+    def __reduce__(self):
+        return (_rebuild_snapshot, (tuple(getattr(self, field) for field in self.__slots__),))
+
+    def count_by_gender(self, gender):
+        return dict(self.gender_counts or ()).get(gender, 0)
+
+def _rebuild_snapshot(values):
+    return ReportSnapshot(**dict(zip(ReportSnapshot.__slots__, values)))
+
+# --------------------------------------------------------------------
+
+class IncomeDistribution(object):
+    # Income histogram and nearest-rank percentiles, overall and per
+    # gender. Plain data only, so it pickles into the report cache and
+    # serialises to JSON as it is.
+
+    def __init__(self, count, buckets, percentiles, genders):
+        self.count = count
+        self.buckets = buckets
+        self.percentiles = percentiles
+        self.genders = genders
+
+    def percentile(self, rank):
+        return dict((item['rank'], item['value']) for item in self.percentiles).get(rank)
+
+    @property
+    def median(self):
+        return self.percentile(50)
+
+    def as_dict(self):
+        def number(value):
+            return None if value is None else str(value)
+        return {
+            'count': self.count,
+            'buckets': [
+                {
+                    'lower': number(bucket['lower']),
+                    'upper': number(bucket['upper']),
+                    'count': bucket['count'],
+                    'genders': {item['gender']: item['count'] for item in bucket['genders']},
+                }
+                for bucket in self.buckets
+            ],
+            'percentiles': {f"p{item['rank']}": number(item['value']) for item in self.percentiles},
+            'genders': {
+                item['gender']: {
+                    'count': item['count'],
+                    'total': number(item['total']),
+                    'avg': number(item['avg']),
+                    'min': number(item['min']),
+                    'max': number(item['max']),
+                    'percentiles': {f"p{rank['rank']}": number(rank['value']) for rank in item['percentiles']},
+                }
+                for item in self.genders
+            },
+        }
+
+# --------------------------------------------------------------------
+
+class ReportEngine(object):
     __instance = None
 
-    def __new__(cls, *args, **kwargs):
+    def __new__(cls):
         if cls.__instance is None:
-            cls.__instance = super(Reports, cls).__new__(cls)
+            cls.__instance = super(ReportEngine, cls).__new__(cls)
         return cls.__instance
 
-    def __init__(self, objects):
-        self.objects = objects or objects.none()
-        self.max_income = self.objects.aggregate(Max('income_range'))['income_range__max']
-        self.min_income = self.objects.aggregate(Min('income_range'))['income_range__min']
-        self.avg_income = self.objects.aggregate(Avg('income_range'))['income_range__avg']
+    def __gender_alias(self, gender):
+        return '_report_gender_' + gender.lower()
+
+    def __use_statistics(self, objects):
+        return not objects.query.has_filters() and not objects.query.is_sliced
+
+    def compute(self, objects):
+        if self.__use_statistics(objects):
+            return self.from_statistics()
+        return self.scan(objects)
+
+    async def acompute(self, objects):
+        if self.__use_statistics(objects):
+            return await self.afrom_statistics()
+        return await self.ascan(objects)
+
+    def from_statistics(self):
+        from ..models import NaturalPersonStatistics
+        return self.__statistics_snapshot(NaturalPersonStatistics.load())
+
+    async def afrom_statistics(self):
+        from ..models import NaturalPersonStatistics
+        return self.__statistics_snapshot(await NaturalPersonStatistics.aload())
+
+    def __statistics_snapshot(self, row):
+        from ..models import NaturalPersonStatistics
+        genders = [gender for gender, _ in Validator().get_genders()]
+        return ReportSnapshot(
+            count=row.total_count,
+            total_income=row.total_income,
+            max_income=row.max_income,
+            min_income=row.min_income,
+            avg_income=row.total_income / row.total_count if row.total_count else None,
+            gender_counts=tuple(
+                (gender, getattr(row, NaturalPersonStatistics.gender_fields[gender], 0)) for gender in genders
+            ),
+            highest_person=row.highest_person,
+            lowest_person=row.lowest_person,
+        )
+
+    def __scan_query(self, objects):
+        genders = [gender for gender, _ in Validator().get_genders()]
+        totals = {
+            '_report_count': Window(Count('pk')),
+            '_report_total': Window(Sum('income_range')),
+            '_report_max': Window(Max('income_range')),
+            '_report_min': Window(Min('income_range')),
+            '_report_avg': Window(Avg('income_range')),
+        }
+        for gender in genders:
+            totals[self.__gender_alias(gender)] = Window(
+                Sum(Case(When(gender=gender, then=1), default=0, output_field=IntegerField()))
+            )
+        # Every row carries the table-wide totals, and the two row numbers
+        # pick out the highest and lowest earner (ties go to the newest
+        # record), so the whole report is one round trip.
+        return objects.order_by().annotate(
+            _report_high=Window(
+                RowNumber(), order_by=[F('income_range').desc(), F('pk').desc()]
+            ),
+            _report_low=Window(
+                RowNumber(), order_by=[F('income_range').asc(), F('pk').desc()]
+            ),
+            **totals
+        ).filter(Q(_report_high=1) | Q(_report_low=1))
+
+    def __scan_snapshot(self, rows):
+        genders = [gender for gender, _ in Validator().get_genders()]
+        if not rows:
+            return ReportSnapshot(
+                count=0,
+                total_income=0,
+                gender_counts=tuple((gender, 0) for gender in genders)
+            )
+        first = rows[0]
+        return ReportSnapshot(
+            count=first._report_count,
+            total_income=first._report_total or 0,
+            max_income=first._report_max,
+            min_income=first._report_min,
+            avg_income=first._report_avg,
+            gender_counts=tuple(
+                (gender, getattr(first, self.__gender_alias(gender)) or 0) for gender in genders
+            ),
+            highest_person=next(row for row in rows if row._report_high == 1),
+            lowest_person=next(row for row in rows if row._report_low == 1),
+        )
+
+    def scan(self, objects):
+        return self.__scan_snapshot(list(self.__scan_query(objects)))
+
+    async def ascan(self, objects):
+        return self.__scan_snapshot([row async for row in self.__scan_query(objects)])
+
+    # ---- income distribution
+
+    def get_bucket_bounds(self):
+        # GVCRUD_INCOME_BUCKETS are the boundaries between buckets: (1000,
+        # 2500) gives "below 1000", "1000 to 2500" and "2500 or more".
+        bounds = sorted(set(getattr(settings, 'GVCRUD_INCOME_BUCKETS', (1000, 2500, 5000, 10000, 20000))))
+        return list(zip([None] + bounds, bounds + [None]))
+
+    def get_percentile_ranks(self):
+        return tuple(sorted(set(getattr(settings, 'GVCRUD_REPORT_PERCENTILES', (50, 90, 99)))))
+
+    def __bucket_filter(self, lower, upper):
+        condition = Q()
+        if lower is not None:
+            condition &= Q(income_range__gte=lower)
+        if upper is not None:
+            condition &= Q(income_range__lt=upper)
+        return condition
+
+    def __distribution_aggregates(self, bounds, genders):
+        aggregates = {'_count': Count('pk')}
+        for index, (lower, upper) in enumerate(bounds):
+            bucket = self.__bucket_filter(lower, upper)
+            aggregates[f'_bucket_{index}'] = Count('pk', filter=bucket)
+            for gender in genders:
+                aggregates[f'_bucket_{index}_{gender}'] = Count('pk', filter=bucket & Q(gender=gender))
+        for gender in genders:
+            only = Q(gender=gender)
+            aggregates[f'_{gender}_count'] = Count('pk', filter=only)
+            aggregates[f'_{gender}_total'] = Sum('income_range', filter=only)
+            aggregates[f'_{gender}_avg'] = Avg('income_range', filter=only)
+            aggregates[f'_{gender}_min'] = Min('income_range', filter=only)
+            aggregates[f'_{gender}_max'] = Max('income_range', filter=only)
+        return aggregates
+
+    def __nearest_rank(self, count, percentile):
+        # ceil(count * p / 100) in integer arithmetic, the same in SQL and
+        # in Python.
+        return (count * percentile + 99) // 100
+
+    def __percentile_query(self, objects, ranks):
+        # Each row is numbered in income order, overall and within its
+        # gender; only the rows sitting at a percentile's rank come back,
+        # so at most a handful of rows leave the database.
+        order = [F('income_range').asc(), F('pk').asc()]
+        condition = Q()
+        for percentile in ranks:
+            condition |= Q(_dist_rank=ExpressionWrapper(
+                (F('_dist_count') * percentile + 99) / 100, output_field=IntegerField()
+            ))
+            condition |= Q(_dist_gender_rank=ExpressionWrapper(
+                (F('_dist_gender_count') * percentile + 99) / 100, output_field=IntegerField()
+            ))
+        return objects.order_by().annotate(
+            _dist_count=Window(Count('pk')),
+            _dist_rank=Window(RowNumber(), order_by=order),
+            _dist_gender_count=Window(Count('pk'), partition_by=[F('gender')]),
+            _dist_gender_rank=Window(RowNumber(), partition_by=[F('gender')], order_by=order),
+        ).filter(condition).values_list(
+            'gender', 'income_range', '_dist_count', '_dist_rank', '_dist_gender_count', '_dist_gender_rank'
+        )
+
+    def __percentiles_from_rows(self, rows, ranks):
+        overall = {}
+        by_gender = {}
+        for gender, income, count, rank, gender_count, gender_rank in rows:
+            for percentile in ranks:
+                if rank == self.__nearest_rank(count, percentile):
+                    overall[percentile] = income
+                if gender_rank == self.__nearest_rank(gender_count, percentile):
+                    by_gender.setdefault(gender, {})[percentile] = income
+        return overall, by_gender
+
+    def __stream_percentiles(self, objects, ranks, totals, gender_totals):
+        # Backends without window functions: one pass over the incomes in
+        # sorted order, picking the values at the precomputed ranks.
+        wanted = {}
+        for percentile in ranks:
+            wanted.setdefault(('', self.__nearest_rank(totals, percentile)), []).append(percentile)
+            for gender, count in gender_totals.items():
+                if count:
+                    wanted.setdefault((gender, self.__nearest_rank(count, percentile)), []).append(percentile)
+        overall = {}
+        by_gender = {}
+        seen = {}
+        rows = objects.order_by('income_range', 'pk').values_list('gender', 'income_range').iterator(chunk_size=5000)
+        for position, (gender, income) in enumerate(rows, start=1):
+            seen[gender] = seen.get(gender, 0) + 1
+            for percentile in wanted.get(('', position), ()):
+                overall[percentile] = income
+            for percentile in wanted.get((gender, seen[gender]), ()):
+                by_gender.setdefault(gender, {})[percentile] = income
+        return overall, by_gender
+
+    def __build_distribution(self, totals, percentiles, bounds, genders, ranks):
+        overall, by_gender = percentiles
+        count = totals['_count']
+        return IncomeDistribution(
+            count=count,
+            buckets=[
+                {
+                    'lower': lower,
+                    'upper': upper,
+                    'count': totals[f'_bucket_{index}'],
+                    'percent': round(100 * totals[f'_bucket_{index}'] / count, 1) if count else 0,
+                    'genders': [
+                        {'gender': gender, 'count': totals[f'_bucket_{index}_{gender}']} for gender in genders
+                    ],
+                }
+                for index, (lower, upper) in enumerate(bounds)
+            ],
+            percentiles=[{'rank': rank, 'value': overall.get(rank)} for rank in ranks],
+            genders=[
+                {
+                    'gender': gender,
+                    'label': label,
+                    'count': totals[f'_{gender}_count'],
+                    'total': totals[f'_{gender}_total'] or 0,
+                    'avg': totals[f'_{gender}_avg'],
+                    'min': totals[f'_{gender}_min'],
+                    'max': totals[f'_{gender}_max'],
+                    'percentiles': [
+                        {'rank': rank, 'value': by_gender.get(gender, {}).get(rank)} for rank in ranks
+                    ],
+                }
+                for gender, label in Validator().get_genders()
+            ],
+        )
+
+    def __supports_windows(self, objects):
+        return connections[objects.db].features.supports_over_clause
+
+    def distribution(self, objects):
+        bounds = self.get_bucket_bounds()
+        ranks = self.get_percentile_ranks()
+        genders = [gender for gender, _ in Validator().get_genders()]
+        totals = objects.order_by().aggregate(**self.__distribution_aggregates(bounds, genders))
+        if self.__supports_windows(objects):
+            percentiles = self.__percentiles_from_rows(self.__percentile_query(objects, ranks), ranks)
+        else:
+            percentiles = self.__stream_percentiles(
+                objects, ranks, totals['_count'], {gender: totals[f'_{gender}_count'] for gender in genders}
+            )
+        return self.__build_distribution(totals, percentiles, bounds, genders, ranks)
+
+    async def adistribution(self, objects):
+        if not self.__supports_windows(objects):
+            return await sync_to_async(self.distribution)(objects)
+        bounds = self.get_bucket_bounds()
+        ranks = self.get_percentile_ranks()
+        genders = [gender for gender, _ in Validator().get_genders()]
+        totals = await objects.order_by().aaggregate(**self.__distribution_aggregates(bounds, genders))
+        rows = [row async for row in self.__percentile_query(objects, ranks)]
+        percentiles = self.__percentiles_from_rows(rows, ranks)
+        return self.__build_distribution(totals, percentiles, bounds, genders, ranks)
+
+def _cache_key(objects, suffix=''):
+    # Per database: a replica behind the primary reads an older version, and
+    # what it computes is kept apart from what the primary does.
+    return f'{objects.db}:{objects.query}{suffix}'
+
+# --------------------------------------------------------------------
+
+class Reports:
+
+    def __init__(self, objects, cache=None, snapshot=None, version=None):
+        # The cache version is read once (or handed in by a view that read
+        # it already), so the snapshot and the distribution of one report
+        # always belong to the same data.
+        self.objects = objects.all()
+        self.cache = cache
+        self.version = version
+        self.snapshot = snapshot or self.__build_snapshot(cache)
+        self.max_income = self.snapshot.max_income
+        self.min_income = self.snapshot.min_income
+        self.avg_income = self.snapshot.avg_income
+
+    def __build_snapshot(self, cache):
+        if cache is None:
+            return ReportEngine().compute(self.objects)
+        key = _cache_key(self.objects)
+        if self.version is None:
+            self.version = cache.version(self.objects)
+        snapshot = cache.get(key, self.version)
+        if snapshot is None:
+            snapshot = ReportEngine().compute(self.objects)
+            cache.set(key, self.version, snapshot)
+        return snapshot
+
+    @classmethod
+    async def abuild(cls, objects, cache=None, version=None):
+        # The async counterpart of Reports(objects, cache): the snapshot is
+        # computed with the async ORM and handed to the constructor.
+        objects = objects.all()
+        if cache is None:
+            return cls(objects, snapshot=await ReportEngine().acompute(objects))
+        key = _cache_key(objects)
+        if version is None:
+            version = await cache.aversion(objects)
+        snapshot = await cache.aget(key, version)
+        if snapshot is None:
+            snapshot = await ReportEngine().acompute(objects)
+            await cache.aset(key, version, snapshot)
+        return cls(objects, cache=cache, snapshot=snapshot, version=version)
+
+    def get_income_distribution(self):
+        if self.cache is None:
+            return ReportEngine().distribution(self.objects)
+        key = _cache_key(self.objects, ':distribution')
+        distribution = self.cache.get(key, self.version)
+        if distribution is None:
+            distribution = ReportEngine().distribution(self.objects)
+            self.cache.set(key, self.version, distribution)
+        return distribution
+
+    async def aget_income_distribution(self):
+        if self.cache is None:
+            return await ReportEngine().adistribution(self.objects)
+        key = _cache_key(self.objects, ':distribution')
+        distribution = await self.cache.aget(key, self.version)
+        if distribution is None:
+            distribution = await ReportEngine().adistribution(self.objects)
+            await self.cache.aset(key, self.version, distribution)
+        return distribution
 
     def get_highest_income_person(self):
-        return self.objects.filter(income_range=self.max_income).first()
+        return self.snapshot.highest_person
 
     def get_lowest_income_person(self):
-        return self.objects.filter(income_range=self.min_income).first()
+        return self.snapshot.lowest_person
 
     def get_people_above_average_income(self):
         return self.objects.filter(income_range__gt=self.avg_income)
@@ -30,11 +425,7 @@ class Reports:
         return self.objects.filter(income_range=self.avg_income)
 
     def count_by_gender(self, gender):
-        return self.objects.aggregate(
-            total=Count('id', filter=Q(gender__exact=gender))
-        )['total'] or 0
+        return self.snapshot.count_by_gender(gender)
 
     def total_income_sum(self):
-        return self.objects.aggregate(
-            total=Sum('income_range')
-        )['total'] or 0
+        return self.snapshot.total_income
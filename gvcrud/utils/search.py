@@ -0,0 +1,235 @@
+import base64
+import json
+import re
+from django.db import connections, DatabaseError
+from django.db.models import F, Lookup, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+# --------------------------------------------------------------------
+from .pagination import KeysetPage, get_page_size
+# --------------------------------------------------------------------
+
+FTS_TABLE = 'person_fts'
+
+# Keep person_fts in step with the person table (as created by migration
+# 0004). SQLite drops them whenever a migration rebuilds that table.
+FTS_TRIGGERS = {
+    f'{FTS_TABLE}_ai': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON person BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END"
+    ),
+    f'{FTS_TABLE}_ad': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON person BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); END"
+    ),
+    f'{FTS_TABLE}_au': (
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name ON person BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name); "
+        f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name); END"
+    ),
+}
+
+def restore_fts_triggers(connection):
+    # Recreates missing triggers and reindexes, since rows written while
+    # they were gone are not in the index. Returns the triggers restored.
+    if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'person'")
+        missing = sorted(set(FTS_TRIGGERS) - {row[0] for row in cursor.fetchall()})
+        for name in missing:
+            cursor.execute(FTS_TRIGGERS[name])
+        if missing:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return missing
+
+class ILike(Lookup):
+    # "name ILIKE pattern" on the bare column (PostgreSQL), which the
+    # gin_trgm_ops indexes on person.name and person.email serve. Django's
+    # icontains compiles to UPPER("name"::text) LIKE UPPER(...), which
+    # those indexes cannot.
+    lookup_name = 'ilike'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} ILIKE {rhs}', (*lhs_params, *rhs_params)
+
+def contains_pattern(value, connection):
+    return f'%{connection.ops.prep_for_like_query(value)}%'
+
+# --------------------------------------------------------------------
+
+class SearchEngine(object):
+    __instance = None
+    __fts_databases = set()
+    fts_table = FTS_TABLE
+
+    def __new__(cls):
+        if cls.__instance is None:
+            cls.__instance = super(SearchEngine, cls).__new__(cls)
+        return cls.__instance
+
+    def classify(self, term):
+        term = term.strip()
+        if re.fullmatch(r'[\d.\-\s]+', term) and re.search(r'\d', term):
+            return 'cpf', re.sub(r'\D', '', term)
+        if '@' in term:
+            return 'email', term.lower()
+        return 'name', term
+
+    def __prefix_filter(self, field, prefix):
+        # SQLite compares text byte by byte, so "prefix <= value <
+        # prefix-successor" holds exactly the values starting with prefix
+        # and is an index range scan, which LIKE 'x%' is not there (SQLite
+        # only optimises it on NOCASE columns). Locale collations (e.g.
+        # en_US.UTF-8 on PostgreSQL) do not sort that way, so elsewhere it
+        # is LIKE 'x%', served on PostgreSQL by the pattern_ops indexes of
+        # migration 0008.
+        if self.__connection().vendor == 'sqlite':
+            end = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            return Q(**{f'{field}__gte': prefix, f'{field}__lt': end})
+        return Q(**{f'{field}__startswith': prefix})
+
+    def __email_filter(self, value):
+        # Contains, so a domain such as "@gmail.com" finds its addresses.
+        # On PostgreSQL the gin_trgm_ops index on person.email serves it.
+        connection = self.__connection()
+        if connection.vendor == 'postgresql':
+            return ILike(F('email'), contains_pattern(value, connection))
+        return Q(email_lower__contains=value)
+
+    def __objects(self):
+        from ..models import NaturalPerson
+        return NaturalPerson.objects.all()
+
+    def __connection(self):
+        # The database the queries are routed to, a read replica included.
+        return connections[self.__objects().db]
+
+    def __search_cpf(self, value, offset, limit):
+        return list(
+            self.__objects().filter(self.__prefix_filter('cpf', value)).order_by('cpf')[offset:offset + limit]
+        )
+
+    def __search_email(self, value, offset, limit):
+        return list(
+            self.__objects().alias(email_lower=Lower('email'))
+            .filter(self.__email_filter(value))
+            .order_by('email_lower', 'id')[offset:offset + limit]
+        )
+
+    def __search_name_prefix(self, value, offset, limit):
+        return list(
+            self.__objects().alias(name_lower=Lower('name'))
+            .filter(self.__prefix_filter('name_lower', value.lower()))
+            .order_by('name_lower', 'id')[offset:offset + limit]
+        )
+
+    def __search_name_trigram(self, value, offset, limit):
+        # The gin_trgm_ops index serves the ILIKE filter; similarity only
+        # orders the matching rows.
+        from django.contrib.postgres.search import TrigramSimilarity
+        return list(
+            self.__objects().filter(ILike(F('name'), contains_pattern(value, self.__connection())))
+            .annotate(rank=TrigramSimilarity('name', value))
+            .order_by(F('rank').desc(), 'id')[offset:offset + limit]
+        )
+
+    def __fts_query(self, value):
+        tokens = re.findall(r'\w+', value)
+        return ' '.join('"' + token.replace('"', '""') + '"*' for token in tokens)
+
+    def __search_name_fts(self, value, offset, limit):
+        query = self.__fts_query(value)
+        if not query:
+            return []
+        with self.__connection().cursor() as cursor:
+            cursor.execute(
+                f'SELECT fts.rowid FROM {self.fts_table} fts '
+                f'INNER JOIN natural_person np ON np.person_ptr_id = fts.rowid '
+                f'WHERE {self.fts_table} MATCH %s ORDER BY fts.rank, fts.rowid LIMIT %s OFFSET %s',
+                [query, limit, offset]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        found = self.__objects().in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found]
+
+    def __search_name(self, value, offset, limit):
+        connection = self.__connection()
+        if connection.vendor == 'postgresql':
+            return self.__search_name_trigram(value, offset, limit)
+        if connection.vendor == 'sqlite' and self.has_fts_table():
+            return self.__search_name_fts(value, offset, limit)
+        return self.__search_name_prefix(value, offset, limit)
+
+    def has_fts_table(self):
+        connection = self.__connection()
+        if connection.settings_dict['NAME'] in self.__fts_databases:
+            return True
+        try:
+            found = self.fts_table in connection.introspection.table_names()
+        except DatabaseError:
+            return False
+        if found:
+            self.__fts_databases.add(connection.settings_dict['NAME'])
+        return found
+
+    def queryset(self, term):
+        # Same matching rules as search(), unranked, for callers that walk
+        # every match (exports) rather than a page of the best ones.
+        kind, value = self.classify(term)
+        objects = self.__objects()
+        if not value:
+            return objects.none()
+        if kind == 'cpf':
+            return objects.filter(self.__prefix_filter('cpf', value))
+        if kind == 'email':
+            return objects.alias(email_lower=Lower('email')).filter(self.__email_filter(value))
+        connection = self.__connection()
+        if connection.vendor == 'postgresql':
+            return objects.filter(ILike(F('name'), contains_pattern(value, connection)))
+        if connection.vendor == 'sqlite' and self.has_fts_table():
+            query = self.__fts_query(value)
+            if not query:
+                return objects.none()
+            return objects.filter(
+                pk__in=RawSQL(f'SELECT rowid FROM {self.fts_table} WHERE {self.fts_table} MATCH %s', [query])
+            )
+        return objects.alias(name_lower=Lower('name')).filter(self.__prefix_filter('name_lower', value.lower()))
+
+    def search(self, term, offset=0, limit=20):
+        kind, value = self.classify(term)
+        if not value:
+            return []
+        if kind == 'cpf':
+            return self.__search_cpf(value, offset, limit)
+        if kind == 'email':
+            return self.__search_email(value, offset, limit)
+        return self.__search_name(value, offset, limit)
+
+    def encode_cursor(self, offset):
+        return base64.urlsafe_b64encode(json.dumps(['offset', offset]).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            kind, offset = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            if kind != 'offset' or not isinstance(offset, int) or offset < 0:
+                return 0
+            return offset
+        except (ValueError, TypeError):
+            return 0
+
+    def page(self, term, cursor=None, per_page=None):
+        # Ranked results have no stable seek key, so search pages by offset
+        # while keeping the same opaque cursors and page object as the list.
+        per_page = per_page or get_page_size()
+        offset = self.decode_cursor(cursor) if cursor else 0
+        rows = self.search(term, offset, per_page + 1)
+        has_more = len(rows) > per_page
+        return KeysetPage(
+            rows[:per_page],
+            next_cursor=self.encode_cursor(offset + per_page) if has_more else None,
+            previous_cursor=self.encode_cursor(max(offset - per_page, 0)) if offset else None
+        )
@@ -0,0 +1,80 @@
+import math
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+# --------------------------------------------------------------------
+from .bulk import bulk_create_natural_persons
+# --------------------------------------------------------------------
+
+# Plausible natural persons for benchmarks and tests: valid and unique
+# CPFs and e-mails, adult birthdays and a long-tailed income spread, so
+# the reports, search and pagination see data shaped like production's.
+
+FIRST_NAMES = (
+    'Ana', 'Maria', 'Juliana', 'Fernanda', 'Patricia', 'Camila', 'Beatriz', 'Larissa',
+    'Jose', 'Joao', 'Carlos', 'Paulo', 'Lucas', 'Marcos', 'Rafael', 'Anderson',
+    'Gabriel', 'Pedro', 'Mariana', 'Aline', 'Bruno', 'Thiago', 'Renata', 'Diego',
+)
+LAST_NAMES = (
+    'Silva', 'Santos', 'Oliveira', 'Souza', 'Rodrigues', 'Ferreira', 'Alves', 'Pereira',
+    'Lima', 'Gomes', 'Costa', 'Ribeiro', 'Martins', 'Carvalho', 'Almeida', 'Lopes',
+    'Soares', 'Fernandes', 'Vieira', 'Barbosa', 'Rocha', 'Dias', 'Nascimento', 'Moreira',
+)
+GENDERS = ('M', 'F', 'O')
+GENDER_WEIGHTS = (48, 48, 4)
+SEED_PICTURE = 'person/natural/seed.png'
+
+# Consecutive numbers are spread over the nine-digit CPF bases by a
+# permutation of 0 .. 10**9 - 1 (the multiplier is coprime with 10**9, so
+# no two numbers share a base). With this offset none of the first 10**8
+# numbers lands on a base of one repeated digit, which is not a valid CPF.
+CPF_MULTIPLIER = 387420489
+CPF_OFFSET = 5
+MAX_SEED_NUMBER = 10 ** 8
+
+def cpf_for(number):
+    base = (number * CPF_MULTIPLIER + CPF_OFFSET) % 10 ** 9
+    digits = [int(digit) for digit in f'{base:09d}']
+    for length in (9, 10):
+        total = sum(digit * (length + 1 - index) for index, digit in enumerate(digits))
+        digits.append(total * 10 % 11 % 10)
+    return ''.join(map(str, digits))
+
+def generate_natural_persons(count, start=0, seed=None):
+    # Unsaved NaturalPerson objects numbered start .. start + count - 1;
+    # the number makes the CPF and e-mail unique, so a later batch starting
+    # where this one ended does not clash with it.
+    from ..models import NaturalPerson
+    rng = random.Random(seed if seed is None else seed + start)
+    youngest = date.today() - timedelta(days=19 * 366)
+    oldest = date(1940, 1, 1)
+    span = (youngest - oldest).days
+    if start < 0 or start + count > MAX_SEED_NUMBER:
+        raise ValueError(f'Seed numbers must stay below {MAX_SEED_NUMBER}.')
+    for number in range(start, start + count):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        income = min(math.exp(rng.gauss(8.0, 0.8)), 9999999999)
+        yield NaturalPerson(
+            name=f'{first} {rng.choice(LAST_NAMES)} {last}',
+            email=f'{first}.{last}.{number}@example.com'.lower(),
+            cpf=cpf_for(number),
+            gender=rng.choices(GENDERS, GENDER_WEIGHTS)[0],
+            birthday=oldest + timedelta(days=rng.randrange(span)),
+            income_range=Decimal(f'{income:.2f}'),
+            status=rng.random() < 0.9,
+            picture=SEED_PICTURE,
+        )
+
+def seed_natural_persons(count, start=0, seed=None, batch_size=10000):
+    # Inserts in batches, so a million rows never sit in memory at once.
+    created = 0
+    batch = []
+    for person in generate_natural_persons(count, start=start, seed=seed):
+        batch.append(person)
+        if len(batch) >= batch_size:
+            created += len(bulk_create_natural_persons(batch))
+            batch = []
+    if batch:
+        created += len(bulk_create_natural_persons(batch))
+    return created
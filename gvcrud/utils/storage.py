@@ -0,0 +1,100 @@
+import hashlib
+import os
+import posixpath
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, InvalidStorageError, storages
+from django.db import transaction
+from django.utils import timezone
+
+# --------------------------------------------------------------------
+
+class ContentAddressedStorage(FileSystemStorage):
+    # Files are stored under the SHA-256 of their bytes, so uploading the
+    # same picture twice keeps a single copy that both rows point at:
+    # person/natural/3f/3f9a...c1.jpg. A name that already exists therefore
+    # holds the same content, and writing it again is skipped.
+
+    def __init__(self, **kwargs):
+        # Two concurrent uploads of one file may both try to write it; the
+        # bytes are identical, so the second write may simply replace it.
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(**kwargs)
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        hexdigest = digest.hexdigest()
+        return posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(self.content_name(name, content), content, max_length=max_length)
+
+    def save_derived(self, name, content):
+        # For files computed from a stored one (thumbnails), which are named
+        # after their source rather than after their own bytes.
+        return super().save(name, content)
+
+    def _save(self, name, content):
+        if self.exists(name):
+            # The file is claimed again: a fresh modification time keeps it
+            # through the grace period of collect_unreferenced() and the
+            # collect_pictures command until the new row is committed.
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
+
+def picture_storage():
+    # STORAGES['pictures'] when configured, the default storage otherwise.
+    try:
+        return storages['pictures']
+    except InvalidStorageError:
+        return storages['default']
+
+# --------------------------------------------------------------------
+
+def get_min_age():
+    # How long a stored picture is kept after it was written (or uploaded
+    # again) even when no row names it: a row saving it may not have been
+    # committed yet.
+    return timedelta(minutes=getattr(settings, 'GVCRUD_PICTURE_MIN_AGE', 60))
+
+def collect_unreferenced(names, storage=None, min_age=None):
+    # Reference counting is done by the database: a stored file is kept
+    # while any person row still names it, which stays correct across
+    # deduplicated uploads, bulk imports and rollbacks. Files younger than
+    # min_age are left to the collect_pictures command.
+    from ..models import Person
+    from .thumbnails import delete_thumbnails
+    storage = storage or picture_storage()
+    names = {name for name in names if name}
+    if not names:
+        return []
+    cutoff = timezone.now() - (get_min_age() if min_age is None else min_age)
+    referenced = set(Person.objects.filter(picture__in=names).values_list('picture', flat=True))
+    removed = []
+    for name in sorted(names - referenced):
+        if storage.exists(name):
+            if storage.get_modified_time(name) > cutoff:
+                continue
+            storage.delete(name)
+            removed.append(name)
+        delete_thumbnails(name, storage=storage)
+    return removed
+
+def release_pictures(names):
+    # Called when rows stop pointing at these files; the check runs once
+    # the change is committed, so a rolled back delete keeps its picture.
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: collect_unreferenced(names))
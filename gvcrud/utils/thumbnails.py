@@ -0,0 +1,104 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+# --------------------------------------------------------------------
+from .storage import picture_storage
+# --------------------------------------------------------------------
+
+logger = logging.getLogger(__name__)
+
+# --------------------------------------------------------------------
+
+def get_thumbnail_sizes():
+    return tuple(sorted(getattr(settings, 'GVCRUD_THUMBNAIL_SIZES', (64, 150, 400))))
+
+def thumbnail_name(name, size):
+    # Thumbnails live next to the original: person/natural/a.jpg gives
+    # person/natural/a_150.webp.
+    root, _ = os.path.splitext(name)
+    return f'{root}_{size}.webp'
+
+def thumbnail_size_for(size):
+    # The smallest generated size that still covers the requested one.
+    sizes = get_thumbnail_sizes()
+    return next((candidate for candidate in sizes if candidate >= size), sizes[-1])
+
+# --------------------------------------------------------------------
+
+def generate_thumbnails(name, storage=None, sizes=None, force=False):
+    storage = storage or picture_storage()
+    sizes = sizes or get_thumbnail_sizes()
+    quality = getattr(settings, 'GVCRUD_THUMBNAIL_QUALITY', 80)
+    pending = [size for size in sizes if force or not storage.exists(thumbnail_name(name, size))]
+    if not pending:
+        return []
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    created = []
+    # Largest first, each crop made from the previous one, so the full-size
+    # image is only resampled once.
+    for size in sorted(pending, reverse=True):
+        image = ImageOps.fit(image, (size, size), method=Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format='WEBP', quality=quality, method=4)
+        thumb = thumbnail_name(name, size)
+        if storage.exists(thumb):
+            storage.delete(thumb)
+        save = getattr(storage, 'save_derived', storage.save)
+        created.append(save(thumb, ContentFile(buffer.getvalue())))
+    return created
+
+def delete_thumbnails(name, storage=None):
+    storage = storage or picture_storage()
+    for size in get_thumbnail_sizes():
+        thumb = thumbnail_name(name, size)
+        if storage.exists(thumb):
+            storage.delete(thumb)
+
+# --------------------------------------------------------------------
+
+class ThumbnailWorker(object):
+    # A small thread pool shared by the process. Resizing runs in Pillow's
+    # C code with the GIL released, so a few threads keep it off the
+    # request path without a separate queue service.
+    __instance = None
+
+    def __new__(cls):
+        if cls.__instance is None:
+            cls.__instance = super(ThumbnailWorker, cls).__new__(cls)
+            cls.__instance.__executor = None
+            cls.__instance.__lock = threading.Lock()
+        return cls.__instance
+
+    @property
+    def executor(self):
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'GVCRUD_THUMBNAIL_WORKERS', 2),
+                    thread_name_prefix='gvcrud-thumbnails'
+                )
+            return self.__executor
+
+    def run(self, name):
+        try:
+            return generate_thumbnails(name)
+        except Exception:
+            logger.exception('Could not generate thumbnails for %s.', name)
+            return []
+
+    def schedule(self, name):
+        # After commit, so a rolled back upload never gets thumbnails and
+        # the worker never reads a file the transaction has not kept.
+        if getattr(settings, 'GVCRUD_THUMBNAIL_ASYNC', True):
+            transaction.on_commit(lambda: self.executor.submit(self.run, name))
+        else:
+            transaction.on_commit(lambda: self.run(name))
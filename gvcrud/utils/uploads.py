@@ -0,0 +1,139 @@
+from django.conf import settings
+from django.core.files.uploadhandler import SkipFile, StopFutureHandlers, TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import ImageFile
+
+# --------------------------------------------------------------------
+
+PICTURE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+
+def sniff_picture(header):
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    for signature, kind in PICTURE_SIGNATURES:
+        if header.startswith(signature):
+            return kind
+    return None
+
+WEBP_HEADER_SIZE = 30
+
+def webp_dimensions(header):
+    # Pillow only identifies a WebP once it has the whole file, so its size
+    # is read from the first chunk: VP8 (lossy), VP8L (lossless) or VP8X
+    # (extended). Returns None when the header is not one of them.
+    if len(header) < WEBP_HEADER_SIZE or header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+        return None
+    chunk = header[12:16]
+    if chunk == b'VP8 ' and header[23:26] == b'\x9d\x01\x2a':
+        return (
+            int.from_bytes(header[26:28], 'little') & 0x3fff,
+            int.from_bytes(header[28:30], 'little') & 0x3fff,
+        )
+    if chunk == b'VP8L' and header[20] == 0x2f:
+        bits = int.from_bytes(header[21:25], 'little')
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(header[24:27], 'little') + 1, int.from_bytes(header[27:30], 'little') + 1
+    return None
+
+# --------------------------------------------------------------------
+
+class PictureUploadHandler(TemporaryFileUploadHandler):
+    # Streams picture fields to a temporary file and checks them while the
+    # bytes arrive: the signature on the first chunk, the dimensions as soon
+    # as the image header has been read, and the size on every chunk. A bad
+    # upload is skipped right there, the rest of the body is discarded
+    # unread into memory, and the reason is left in request.upload_errors
+    # for the form to report. Other file fields go to the next handlers.
+
+    chunk_size = 64 * 1024
+    header_limit = 256 * 1024
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.active = False
+        if request is not None and not hasattr(request, 'upload_errors'):
+            request.upload_errors = {}
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'GVCRUD_PICTURE_MAX_SIZE', 5 * 1024 * 1024)
+
+    @property
+    def max_dimensions(self):
+        return getattr(settings, 'GVCRUD_PICTURE_MAX_DIMENSIONS', (4000, 4000))
+
+    def reject(self, message):
+        if self.request is not None:
+            self.request.upload_errors.setdefault(self.field_name, []).append(message)
+        raise SkipFile(message)
+
+    def new_file(self, field_name, *args, **kwargs):
+        self.active = field_name in getattr(settings, 'GVCRUD_PICTURE_FIELDS', ('picture',))
+        if not self.active:
+            return
+        super().new_file(field_name, *args, **kwargs)
+        if self.content_length is not None and self.content_length > self.max_size:
+            self.reject(f'Picture is larger than {filesizeformat(self.max_size)}.')
+        self.received = 0
+        self.kind = None
+        self.parser = ImageFile.Parser()
+        self.header = b''
+        self.dimensions = None
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.reject(f'Picture is larger than {filesizeformat(self.max_size)}.')
+        if self.kind is None:
+            self.kind = sniff_picture(raw_data[:16])
+            if self.kind is None:
+                self.reject('File is not a JPEG, PNG, GIF or WebP picture.')
+        if self.dimensions is None:
+            self.check_dimensions(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def read_dimensions(self, raw_data):
+        if self.kind == 'WEBP':
+            self.header += raw_data[:WEBP_HEADER_SIZE - len(self.header)]
+            if len(self.header) < WEBP_HEADER_SIZE:
+                return None
+            dimensions = webp_dimensions(self.header)
+            if dimensions is None:
+                self.reject('Picture could not be read.')
+            return dimensions
+        try:
+            self.parser.feed(raw_data)
+        except Exception:
+            self.reject('Picture could not be read.')
+        if self.parser.image is None:
+            if self.received > self.header_limit:
+                self.reject('Picture could not be read.')
+            return None
+        return self.parser.image.size
+
+    def check_dimensions(self, raw_data):
+        self.dimensions = self.read_dimensions(raw_data)
+        if self.dimensions is None:
+            return
+        max_width, max_height = self.max_dimensions
+        width, height = self.dimensions
+        if width > max_width or height > max_height:
+            self.reject(f'Picture must be at most {max_width}x{max_height} pixels.')
+        # The header is all the parser was needed for.
+        self.parser = None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if self.dimensions is None and self.request is not None:
+            self.request.upload_errors.setdefault(self.field_name, []).append('Picture could not be read.')
+        return super().file_complete(file_size)
@@ -1,6 +1,20 @@
+import re
 from django.core.validators import RegexValidator, EmailValidator
 from django.core.exceptions import ValidationError
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# --------------------------------------------------------------------
+
+# Used with fullmatch(): a "$" anchor would also accept a trailing newline.
+CPF_FORMAT = re.compile(r'\d{3}\.?\d{3}\.?\d{3}-?\d{2}')
+CPF_FIRST_WEIGHTS = tuple(range(10, 1, -1))
+CPF_SECOND_WEIGHTS = tuple(range(11, 1, -1))
+CPF_VECTORIZE_FROM = 32
+
 # --------------------------------------------------------------------
 
 class Validator(object):
@@ -38,38 +52,95 @@ class Validator(object):
             raise ValidationError('Name cannot exceed 50 characters.')
         return data
 
-    def validate_email(self, data, instance=None):
+    def validate_email_format(self, data):
         if not data or not data.strip():
             raise ValidationError('E-mail is empty.')
         validator = EmailValidator(message='Invalid e-mail.')
         validator(data)
-        from ..models import Person
-        person = Person.objects.filter(email__iexact=data).first()
-        if person and (instance is None or instance.pk != person.pk):
+        return data
+
+    def validate_email(self, data, instance=None):
+        self.validate_email_format(data)
+        if data.lower() in self.find_registered(emails=[data], instance=instance)['email']:
             raise ValidationError('E-mail already is registered.')
         return data
 
-    def __validate_cpf_number(self, cpf):
-        cpf = ''.join(filter(str.isdigit, cpf))
-        if len(cpf) != 11:
-            return False
-        if cpf == cpf[0] * 11:
-            return False
-        soma = sum(int(cpf[i]) * (10 - i) for i in range(9))
-        digito1 = (soma * 10 % 11) % 10
-        soma = sum(int(cpf[i]) * (11 - i) for i in range(10))
-        digito2 = (soma * 10 % 11) % 10
-        return int(cpf[9]) == digito1 and int(cpf[10]) == digito2
+    def find_registered(self, emails=(), cpfs=(), instance=None, exclude=()):
+        # Checks a whole batch of e-mails (case-insensitively, through the
+        # LOWER(email) unique index) and CPFs in a single UNION query and
+        # returns the ones already taken by someone other than instance or
+        # the persons whose pks are in exclude.
+        from django.db.models import CharField, Value
+        from django.db.models.functions import Lower
+        from ..models import Person, NaturalPerson
+        emails = {email.strip().lower() for email in emails if email}
+        cpfs = {cpf for cpf in cpfs if cpf}
+        found = {'email': set(), 'cpf': set()}
+        queries = []
+        if emails:
+            queries.append(
+                Person.objects.alias(email_lower=Lower('email'))
+                .filter(email_lower__in=emails)
+                .values_list(Value('email', output_field=CharField()), Lower('email'))
+            )
+        if cpfs:
+            queries.append(
+                NaturalPerson.objects.filter(cpf__in=cpfs)
+                .values_list(Value('cpf', output_field=CharField()), 'cpf')
+            )
+        if not queries:
+            return found
+        exclude = set(exclude)
+        if instance is not None and instance.pk:
+            exclude.add(instance.pk)
+        if exclude:
+            queries = [query.exclude(pk__in=exclude) for query in queries]
+        query = queries[0].order_by()
+        if len(queries) > 1:
+            query = query.union(queries[1].order_by(), all=True)
+        for kind, value in query:
+            found[kind].add(value)
+        return found
+
+    def __cpf_check_digits(self, digits):
+        first = sum(digit * weight for digit, weight in zip(digits, CPF_FIRST_WEIGHTS)) * 10 % 11 % 10
+        second = sum(digit * weight for digit, weight in zip(digits, CPF_SECOND_WEIGHTS)) * 10 % 11 % 10
+        return digits[9] == first and digits[10] == second and digits.count(digits[0]) != 11
+
+    def __cpf_mask(self, candidates):
+        if numpy is None or len(candidates) < CPF_VECTORIZE_FROM:
+            return [self.__cpf_check_digits([ord(char) - 48 for char in cpf]) for cpf in candidates]
+        # One (n, 11) digit matrix; both check digits are a matrix-vector
+        # product over it instead of a Python loop per character.
+        digits = numpy.frombuffer(''.join(candidates).encode('ascii'), dtype=numpy.uint8)
+        digits = digits.reshape(-1, 11).astype(numpy.int64) - 48
+        first = digits[:, :9] @ numpy.array(CPF_FIRST_WEIGHTS) * 10 % 11 % 10
+        second = digits[:, :10] @ numpy.array(CPF_SECOND_WEIGHTS) * 10 % 11 % 10
+        repeated = (digits == digits[:, :1]).all(axis=1)
+        return ((digits[:, 9] == first) & (digits[:, 10] == second) & ~repeated).tolist()
+
+    def validate_cpf_batch(self, values):
+        is_array = numpy is not None and isinstance(values, numpy.ndarray)
+        values = ['' if value is None else str(value).strip() for value in (values.tolist() if is_array else values)]
+        normalized = [
+            value.replace(".", "").replace("-", "") if value.isascii() and CPF_FORMAT.fullmatch(value) else None
+            for value in values
+        ]
+        candidates = [cpf for cpf in normalized if cpf is not None]
+        valid = iter(self.__cpf_mask(candidates))
+        mask = [cpf is not None and next(valid) for cpf in normalized]
+        normalized = [cpf if ok else None for cpf, ok in zip(normalized, mask)]
+        if is_array:
+            return numpy.array(mask, dtype=bool), numpy.array(normalized, dtype=object)
+        return mask, normalized
 
     def validate_cpf(self, data):
         if not data or not data.strip():
             raise ValidationError('CPF is empty.')
-        validator = RegexValidator(r'^\d{3}\.?\d{3}\.?\d{3}-?\d{2}$', message='Invalid CPF.')
-        validator(data)
-        data = data.replace(".","").replace("-","")
-        if not self.__validate_cpf_number(data):
+        mask, normalized = self.validate_cpf_batch([data])
+        if not mask[0]:
             raise ValidationError('Invalid CPF.')
-        return data
+        return normalized[0]
     
     def validate_gender(self, data):
         if not data or not data.strip():
@@ -101,10 +172,13 @@ class Validator(object):
         return data
     
     def __format_decimal(self, data):
-        from decimal import Decimal
+        from decimal import Decimal, InvalidOperation
         data = data.replace("R", "").replace("$", "").replace(" ", "")
         data = data.replace(".", "").replace(",", ".")
-        return Decimal(data)
+        try:
+            return Decimal(data)
+        except InvalidOperation:
+            raise ValidationError('Invalid income range.')
     
     def validate_income_range(self, data):
         from decimal import Decimal
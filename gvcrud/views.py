@@ -1,20 +1,33 @@
+import hashlib
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.shortcuts import render, redirect
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect, resolve_url
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date
 from django.views.generic import (
     View, CreateView, DetailView, UpdateView
 )
 # --------------------------------------------------------------------
-from .models import NaturalPerson
+from .models import NaturalPerson, NaturalPersonStatistics
 from .form import LoginForm, SearchPersonForm, NaturalPersonForm
+from .utils.cache import report_cache
+from .utils.export import EXPORT_FORMATS, astream
+from .utils.metrics import metrics
+from .utils.pagination import KeysetPaginator, get_page_size
+from .utils.replicas import current_routing, replica_pool
 from .utils.reports import Reports
+from .utils.search import SearchEngine
 # --------------------------------------------------------------------
 
-from django.db.models import Q
 
 def home(request):
     return render(request, 'home/home.html', {})
@@ -58,7 +71,156 @@ def logoff(request):
 
 # --------------------------------------------------------------------
 
-class NaturalPersonListView(LoginRequiredMixin, View):
+def metrics_view(request):
+    # Prometheus scrapes without logging in, so it sends GVCRUD_METRICS_TOKEN
+    # as a bearer token; logged-in staff need none. The client address is
+    # not trusted: behind a proxy on the same host every request comes from
+    # 127.0.0.1.
+    token = getattr(settings, 'GVCRUD_METRICS_TOKEN', '')
+    sent = request.headers.get('Authorization', '')
+    if not (token and constant_time_compare(sent, f'Bearer {token}')) and not request.user.is_staff:
+        return HttpResponseForbidden('Forbidden.', content_type='text/plain')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# --------------------------------------------------------------------
+
+class ConditionalGetMixin(object):
+    # Answers GET and HEAD with 304 Not Modified when the validators from
+    # get_validators() (or aget_validators() on async views) still match
+    # the client's copy, before the page is built. Pages carrying a flash
+    # message are never validated, or a later 304 would replay the message.
+    # Pages differ per user, so they are only stored by the browser.
+
+    def get_validators(self, request, *args, **kwargs):
+        return None, None
+
+    async def aget_validators(self, request, *args, **kwargs):
+        return await sync_to_async(self.get_validators)(request, *args, **kwargs)
+
+    def make_etag(self, request, *parts):
+        key = '|'.join(str(part) for part in (request.user.pk, request.get_full_path()) + parts)
+        return 'W/"{}"'.format(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+
+    def is_conditional(self, request):
+        return request.method in ('GET', 'HEAD') and not len(messages.get_messages(request))
+
+    def not_modified(self, request, etag, last_modified):
+        if etag is None and last_modified is None:
+            return None
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified and int(last_modified.timestamp())
+        )
+        return self.add_validators(response, etag, last_modified) if response is not None else None
+
+    def add_validators(self, response, etag=None, last_modified=None):
+        if etag and not response.has_header('ETag'):
+            response['ETag'] = etag
+        if last_modified and not response.has_header('Last-Modified'):
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.__adispatch(request, *args, **kwargs)
+        if not self.is_conditional(request):
+            return super().dispatch(request, *args, **kwargs)
+        etag, last_modified = self.get_validators(request, *args, **kwargs)
+        response = self.not_modified(request, etag, last_modified)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code == 200:
+                self.add_validators(response, etag, last_modified)
+        return response
+
+    async def __adispatch(self, request, *args, **kwargs):
+        if not self.is_conditional(request):
+            return await super().dispatch(request, *args, **kwargs)
+        etag, last_modified = await self.aget_validators(request, *args, **kwargs)
+        response = self.not_modified(request, etag, last_modified)
+        if response is None:
+            response = await super().dispatch(request, *args, **kwargs)
+            if response.status_code == 200:
+                self.add_validators(response, etag, last_modified)
+        return response
+
+class DataVersionMixin(ConditionalGetMixin):
+    # Validated against the version on the statistics row, which every
+    # natural person write moves in its own transaction, so the ETag is the
+    # same in every process. Kept in data_version for views that key their
+    # own reads (the report cache) on it.
+    data_version = None
+
+    def get_data_validators(self, request):
+        if self.data_version is None:
+            return None, None
+        return self.make_etag(request, self.data_version), None
+
+    def get_validators(self, request, *args, **kwargs):
+        self.data_version = NaturalPersonStatistics.get_version()
+        return self.get_data_validators(request)
+
+    async def aget_validators(self, request, *args, **kwargs):
+        self.data_version = await NaturalPersonStatistics.aget_version()
+        return self.get_data_validators(request)
+
+class RecordVersionMixin(ConditionalGetMixin):
+    # Validated against the record's own updated_at, read without loading
+    # the rest of the row, and the picture URL the page shows: the thumbnail
+    # replaces the original once generated, without updated_at moving.
+    picture_size = 400
+
+    def get_picture_url(self, name):
+        return NaturalPerson(picture=name).picture_thumb_url(self.picture_size) if name else ''
+
+    def get_record_validators(self, request, stamps, picture_url):
+        if stamps is None:
+            return None, None
+        last_modified = stamps[0] or stamps[1]
+        return self.make_etag(request, last_modified.isoformat(), picture_url), last_modified
+
+    def get_validators(self, request, pk, *args, **kwargs):
+        stamps = NaturalPerson.objects.filter(pk=pk).values_list('updated_at', 'created_at', 'picture').first()
+        return self.get_record_validators(request, stamps, self.get_picture_url(stamps and stamps[2]))
+
+    async def aget_validators(self, request, pk, *args, **kwargs):
+        stamps = await NaturalPerson.objects.filter(pk=pk).values_list('updated_at', 'created_at', 'picture').afirst()
+        picture_url = await sync_to_async(self.get_picture_url)(stamps and stamps[2])
+        return self.get_record_validators(request, stamps, picture_url)
+
+# --------------------------------------------------------------------
+
+class ReplicaReadMixin(object):
+    # Read-only pages: the queries they run go to a read replica (see
+    # utils/replicas.py) unless the client wrote recently and has to see
+    # its own changes. Only the view is routed; the session and user were
+    # loaded from the primary before it runs.
+
+    def dispatch(self, request, *args, **kwargs):
+        state = current_routing.get()
+        if state is None:
+            return super().dispatch(request, *args, **kwargs)
+        if self.view_is_async:
+            return self.__adispatch(state, request, *args, **kwargs)
+        state.database = replica_pool.acquire(state.pinned)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            replica_pool.release(state.database)
+            state.database = None
+
+    async def __adispatch(self, state, request, *args, **kwargs):
+        state.database = replica_pool.acquire(state.pinned)
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        finally:
+            replica_pool.release(state.database)
+            state.database = None
+
+class NaturalPersonListView(LoginRequiredMixin, ReplicaReadMixin, DataVersionMixin, View):
     login_url = 'login-auth'
 
     def get_context_data(self, **kwargs):
@@ -66,26 +228,26 @@ class NaturalPersonListView(LoginRequiredMixin, View):
         context["show_list"] = False
         return context
 
+    def render_page(self, request, form, search):
+        per_page = get_page_size(request.GET.get('page_size'))
+        cursor = request.GET.get('cursor')
+        if search:
+            persons = SearchEngine().page(search, cursor, per_page=per_page)
+        else:
+            persons = KeysetPaginator(NaturalPerson.objects.all(), per_page=per_page).page(cursor)
+        return render(request, 'person/list.html', {'form': form, 'persons': persons, 'search': search})
+
     def get(self, request, *args, **kwargs):
-        persons = NaturalPerson.objects.all()
-        form = SearchPersonForm()
-        return render(request, 'person/list.html', {'form': form, 'persons': persons})
+        search = request.GET.get('search', '').strip()
+        form = SearchPersonForm(initial={'search': search})
+        return self.render_page(request, form, search)
 
     def post(self, request, *args, **kwargs):
         form = SearchPersonForm(request.POST)
+        search = ''
         if form.is_valid():
             search = form.cleaned_data['search'].strip()
-            if search:
-                persons = NaturalPerson.objects.filter(
-                    Q(name__istartswith=search) | 
-                    Q(cpf__icontains=search) | 
-                    Q(email__icontains=search) 
-                )
-            else:
-                persons = NaturalPerson.objects.all()
-        else:
-            persons = NaturalPerson.objects.all()
-        return render(request, 'person/list.html', {'form': form, 'persons': persons})
+        return self.render_page(request, form, search)
         
 class NaturalPersonCreateView(LoginRequiredMixin, CreateView):
     model = NaturalPerson
@@ -98,26 +260,26 @@ class NaturalPersonCreateView(LoginRequiredMixin, CreateView):
         context["show_list"] = True 
         context["edition"] = False 
         return context
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['upload_errors'] = getattr(self.request, 'upload_errors', None)
+        return kwargs
     
     def get_success_url(self):
         messages.success(self.request, 'Successfully created.')
         return reverse_lazy('natural-list')
     
-class NaturalPersonDetailView(LoginRequiredMixin, DetailView):
+class NaturalPersonDetailView(LoginRequiredMixin, RecordVersionMixin, DetailView):
     model = NaturalPerson
     template_name="person/detail.html"
     login_url = 'login-auth'
     context_object_name = 'person'
 
-    def dispatch(self, request, *args, **kwargs):
-        self.obj = self.get_object()
-        return super().dispatch(request, *args, **kwargs)
-    
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["show_list"] = True
-        context["income_range_fmt"] = f"R$ {str(self.obj.income_range).replace(".",",")}" 
+        context["income_range_fmt"] = f"R$ {str(self.object.income_range).replace(".",",")}" 
         return context
 
 class NaturalPersonUpdateView(LoginRequiredMixin, UpdateView):
@@ -126,25 +288,25 @@ class NaturalPersonUpdateView(LoginRequiredMixin, UpdateView):
     login_url = 'login-auth'
     form_class = NaturalPersonForm
 
-    def dispatch(self, request, *args, **kwargs):
-        self.object = self.get_object()
-        return super().dispatch(request, *args, **kwargs)
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["show_list"] = True 
         context["edition"] = True
-        context["picture_url"] = self.object.picture.url
+        context["picture_url"] = self.object.picture.url if self.object.picture else None
         return context
 
     def post(self, request, *args, **kwargs):
-        person = self.get_object()
+        # Fetched here rather than in dispatch(), which ran before the login
+        # check and made GET (which fetches it again) load the row twice.
+        person = self.object = self.get_object()
         if 'delete' in request.POST:
             person.delete()
             messages.success(request,'Successfully deleted.')
             return redirect(reverse_lazy('natural-list')) 
-        form = self.form_class(request.POST, request.FILES, instance=person)
-        print(form.fields['picture'])
+        form = self.form_class(
+            request.POST, request.FILES, instance=person,
+            upload_errors=getattr(request, 'upload_errors', None)
+        )
         if form.is_valid():
             form.instance.updated_at = timezone.now()
             form.save()
@@ -153,42 +315,229 @@ class NaturalPersonUpdateView(LoginRequiredMixin, UpdateView):
         return render(request, self.template_name, {'form': form, 'edition':True})
 
 
-class NaturalPersonReportsView(View):
+class NaturalPersonReportsView(ReplicaReadMixin, DataVersionMixin, View):
+    list_fields = ('id', 'cpf', 'name', 'income_range', 'created_at', 'updated_at')
+    buckets = (
+        ('above', 'people_above_avg', 'get_people_above_average_income'),
+        ('below', 'people_below_avg', 'get_people_below_average_income'),
+        ('equal', 'people_equal_avg', 'get_people_with_average_income'),
+    )
 
-    def dispatch(self, request, *args, **kwargs):
-        self.natural_persons = NaturalPerson.objects.all()  
-        self.report = Reports(self.natural_persons)
-        return super().dispatch(request, *args, **kwargs)
-    
     def get_context_data(self, **kwargs):
+        pages = {
+            name: self.get_bucket_page(bucket, getattr(self.report, method)())
+            for bucket, name, method in self.buckets
+        }
+        pages['distribution'] = self.report.get_income_distribution()
+        return self.get_report_context(pages)
+
+    def get_report_context(self, pages):
         context = {}
-        print(self.report.get_highest_income_person())
         context.update({
             'highest_income_person': self.report.get_highest_income_person(),
             'lowest_income_person': self.report.get_lowest_income_person(),
             'avg_income': self.report.avg_income,
             'max_income': self.report.max_income,
             'min_income': self.report.min_income,
-            'people_above_avg': self.report.get_people_above_average_income(),
-            'people_below_avg': self.report.get_people_below_average_income(),
-            'people_equal_avg': self.report.get_people_with_average_income(),
             'male_count': self.report.count_by_gender('M'),
             'female_count': self.report.count_by_gender('F'),
             'other_count': self.report.count_by_gender('O'),
             'total_income': f"R$ {str(self.report.total_income_sum()).replace('.',',')}",
         })
+        context.update(pages)
         return context
 
-    def get(self, request, *args, **kwargs):
-        if self.natural_persons:
-            context = self.get_context_data()
+    def get_bucket_paginator(self, objects):
+        return KeysetPaginator(
+            objects.values(*self.list_fields), 
+            per_page=get_page_size(self.request.GET.get('page_size'))
+        )
+
+    def get_bucket_page(self, bucket, objects):
+        param = f'{bucket}_cursor'
+        page = self.get_bucket_paginator(objects).page(self.request.GET.get(param))
+        return self.link_bucket_page(page, param)
+
+    def link_bucket_page(self, page, param):
+        page.next_query = self.get_bucket_query(param, page.next_cursor)
+        page.previous_query = self.get_bucket_query(param, page.previous_cursor)
+        return page
+
+    def get_bucket_query(self, param, cursor):
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query[param] = cursor
+        return query.urlencode()
+
+    def render_report(self, request, context):
+        if context is not None:
             return render(request, 'person/report.html', context)
-        else:
-            messages.info(request,'No records found for report creation.')
+        messages.info(request,'No records found for report creation.')
         return redirect(reverse_lazy('natural-list')) 
 
-    
-# --------------------------------------------------------------------    
+    def get(self, request, *args, **kwargs):
+        self.report = Reports(NaturalPerson.objects.all(), cache=report_cache, version=self.data_version)
+        context = self.get_context_data() if self.report.snapshot.count else None
+        return self.render_report(request, context)
+
+class NaturalPersonDistributionView(ReplicaReadMixin, View):
+    # Public, as the report page it feeds.
+
+    def get(self, request, *args, **kwargs):
+        report = Reports(NaturalPerson.objects.all(), cache=report_cache)
+        return JsonResponse(report.get_income_distribution().as_dict())
+
+# --------------------------------------------------------------------
+# Async views, routed instead of the ones above when GVCRUD_ASYNC_VIEWS
+# is on (the ASGI entry point turns it on). They query through the async
+# ORM, so a request waiting on the database does not hold a worker thread.
+# Django runs those queries, and the blocking template rendering (cache,
+# picture storage), one at a time on its thread-sensitive executor: this
+# takes them off the event loop but does not run them in parallel.
+
+class AsyncUserMixin(object):
+    login_url = 'login-auth'
+    login_required = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Templates read request.user; resolving the lazy user here keeps
+        # them from querying the session and user tables inside the loop.
+        request.user = await request.auser()
+        if self.login_required and not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), resolve_url(self.login_url))
+        return await super().dispatch(request, *args, **kwargs)
+
+class AsyncNaturalPersonListView(AsyncUserMixin, ReplicaReadMixin, DataVersionMixin, View):
+
+    async def render_page(self, request, form, search):
+        per_page = get_page_size(request.GET.get('page_size'))
+        cursor = request.GET.get('cursor')
+        if search:
+            # SQLite full-text search goes through a raw cursor, which has
+            # no async interface.
+            persons = await sync_to_async(SearchEngine().page)(search, cursor, per_page=per_page)
+        else:
+            persons = await KeysetPaginator(NaturalPerson.objects.all(), per_page=per_page).apage(cursor)
+        return await sync_to_async(render)(request, 'person/list.html', {'form': form, 'persons': persons, 'search': search})
+
+    async def get(self, request, *args, **kwargs):
+        search = request.GET.get('search', '').strip()
+        form = SearchPersonForm(initial={'search': search})
+        return await self.render_page(request, form, search)
+
+    async def post(self, request, *args, **kwargs):
+        form = SearchPersonForm(request.POST)
+        search = ''
+        if form.is_valid():
+            search = form.cleaned_data['search'].strip()
+        return await self.render_page(request, form, search)
+
+class AsyncNaturalPersonDetailView(AsyncUserMixin, RecordVersionMixin, View):
+    template_name = "person/detail.html"
 
+    async def get(self, request, pk, *args, **kwargs):
+        try:
+            person = await NaturalPerson.objects.aget(pk=pk)
+        except NaturalPerson.DoesNotExist:
+            raise Http404('No natural person found matching the query.')
+        return await sync_to_async(render)(request, self.template_name, {
+            'person': person,
+            'object': person,
+            'show_list': True,
+            'income_range_fmt': f"R$ {str(person.income_range).replace('.',',')}",
+        })
+
+class AsyncNaturalPersonReportsView(AsyncUserMixin, NaturalPersonReportsView):
+    login_required = False
+
+    async def get_bucket_page(self, bucket, objects):
+        param = f'{bucket}_cursor'
+        page = await self.get_bucket_paginator(objects).apage(self.request.GET.get(param))
+        return self.link_bucket_page(page, param)
+
+    async def get_context_data(self, **kwargs):
+        context = {}
+        for bucket, name, method in self.buckets:
+            context[name] = await self.get_bucket_page(bucket, getattr(self.report, method)())
+        context['distribution'] = await self.report.aget_income_distribution()
+        return self.get_report_context(context)
+
+    async def get(self, request, *args, **kwargs):
+        self.report = await Reports.abuild(NaturalPerson.objects.all(), cache=report_cache, version=self.data_version)
+        context = await self.get_context_data() if self.report.snapshot.count else None
+        return await sync_to_async(self.render_report)(request, context)
+
+class ExportMixin(object):
+    chunk_size = 2000
+
+    def get_rows(self, persons, fields):
+        # The rows are read while the response streams, after the view has
+        # returned, so the database is settled now (a replica when routed).
+        persons = persons.using(persons.db)
+        return persons.order_by('-created_at', '-id').values_list(*fields).iterator(chunk_size=self.chunk_size)
+
+    def get_export_response(self, fmt, filename, header, rows):
+        if fmt not in EXPORT_FORMATS:
+            raise Http404('Unknown export format.')
+        stream, content_type = EXPORT_FORMATS[fmt]
+        chunks = stream(header, rows)
+        if self.view_is_async:
+            chunks = astream(chunks)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+        return response
+
+class NaturalPersonExportView(LoginRequiredMixin, ReplicaReadMixin, ExportMixin, View):
+    login_url = 'login-auth'
+    header = ('CPF', 'Name', 'E-mail', 'Gender', 'Birthday', 'Income Range', 'Status', 'Created At')
+    fields = ('cpf', 'name', 'email', 'gender', 'birthday', 'income_range', 'status', 'created_at')
 
-    
\ No newline at end of file
+    def get_persons(self, request):
+        search = request.GET.get('search', '').strip()
+        if search:
+            return SearchEngine().queryset(search)
+        return NaturalPerson.objects.all()
+
+    def get(self, request, fmt, *args, **kwargs):
+        rows = self.get_rows(self.get_persons(request), self.fields)
+        return self.get_export_response(fmt, 'natural_persons', self.header, rows)
+
+class NaturalPersonReportExportView(LoginRequiredMixin, ReplicaReadMixin, ExportMixin, View):
+    login_url = 'login-auth'
+    header = ('CPF', 'Name', 'Income Range')
+    fields = ('cpf', 'name', 'income_range')
+    buckets = {
+        'above': 'get_people_above_average_income',
+        'below': 'get_people_below_average_income',
+        'equal': 'get_people_with_average_income',
+    }
+
+    def get_persons(self, report, bucket):
+        if bucket not in self.buckets:
+            raise Http404('Unknown report list.')
+        if report.avg_income is None:
+            return NaturalPerson.objects.none()
+        return getattr(report, self.buckets[bucket])()
+
+    def get(self, request, bucket, fmt, *args, **kwargs):
+        report = Reports(NaturalPerson.objects.all(), cache=report_cache)
+        rows = self.get_rows(self.get_persons(report, bucket), self.fields)
+        return self.get_export_response(fmt, f'report_{bucket}_average', self.header, rows)
+
+class AsyncNaturalPersonExportView(AsyncUserMixin, NaturalPersonExportView):
+
+    async def get(self, request, fmt, *args, **kwargs):
+        # SQLite full-text search checks for its table through a raw cursor.
+        persons = await sync_to_async(self.get_persons)(request)
+        rows = self.get_rows(persons, self.fields)
+        return self.get_export_response(fmt, 'natural_persons', self.header, rows)
+
+class AsyncNaturalPersonReportExportView(AsyncUserMixin, NaturalPersonReportExportView):
+
+    async def get(self, request, bucket, fmt, *args, **kwargs):
+        report = await Reports.abuild(NaturalPerson.objects.all(), cache=report_cache)
+        rows = self.get_rows(self.get_persons(report, bucket), self.fields)
+        return self.get_export_response(fmt, f'report_{bucket}_average', self.header, rows)
+
+# --------------------------------------------------------------------
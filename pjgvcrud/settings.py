@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,11 +41,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gvcrud.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'gvcrud.middleware.ProfilingMiddleware',
+    'gvcrud.middleware.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -53,7 +57,8 @@ ROOT_URLCONF = 'pjgvcrud.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for PerformanceMiddleware.
+        'BACKEND': 'gvcrud.utils.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -79,6 +84,99 @@ DATABASES = {
     }
 }
 
+# Read replicas of "default". Any other entry of DATABASES is taken as
+# one; GVCRUD_REPLICA_DATABASES adds SQLite files (comma separated) to
+# try the routing locally against copies of db.sqlite3. Tests read them
+# from the test database itself (TEST MIRROR).
+for index, name in enumerate(filter(None, os.environ.get('GVCRUD_REPLICA_DATABASES', '').split(',')), 1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['gvcrud.utils.replicas.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered fragments are many and small; apart from "default" they
+    # cannot push the report cache's version key out when culled.
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gvcrud-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
+# Report results are kept in this cache alias, keyed on a version that
+# every natural person write moves in the database, so no worker serves
+# results older than the data it reads. A shared backend (Redis,
+# Memcached) lets several worker processes reuse each other's results.
+GVCRUD_REPORT_CACHE = 'default'
+GVCRUD_REPORT_CACHE_TTL = 300
+
+# Rendered list rows and report cards, keyed by person and updated_at.
+# Bump GVCRUD_FRAGMENT_VERSION after changing the row or card templates
+# so fragments rendered by the old ones are no longer read.
+GVCRUD_FRAGMENT_CACHE = 'fragments'
+GVCRUD_FRAGMENT_CACHE_TTL = 600
+GVCRUD_FRAGMENT_VERSION = 2
+
+# Boundaries of the report's income histogram buckets, and the
+# percentiles shown next to it.
+GVCRUD_INCOME_BUCKETS = (1000, 2500, 5000, 10000, 20000)
+GVCRUD_REPORT_PERCENTILES = (50, 90, 99)
+
+# Rows per page on the natural person list; "?page_size=" may ask for a
+# different size up to the maximum.
+GVCRUD_PAGE_SIZE = 20
+GVCRUD_MAX_PAGE_SIZE = 100
+
+# Square WebP thumbnails generated next to each uploaded picture, in a
+# background thread pool unless GVCRUD_THUMBNAIL_ASYNC is off.
+GVCRUD_THUMBNAIL_SIZES = (64, 150, 400)
+GVCRUD_THUMBNAIL_QUALITY = 80
+GVCRUD_THUMBNAIL_WORKERS = 2
+GVCRUD_THUMBNAIL_ASYNC = True
+
+# Most records one bulk API request may create, update or delete.
+GVCRUD_API_MAX_BULK = 5000
+
+# Serve the list, detail and report pages with the async views. asgi.py
+# switches this on; under WSGI the sync views are kept, since async views
+# there would run on a per-request event loop.
+GVCRUD_ASYNC_VIEWS = os.environ.get('GVCRUD_ASYNC_VIEWS', '0') == '1'
+
+# PerformanceMiddleware adds a Server-Timing header to every response
+# unless this is off. /metrics answers staff, and scrapers sending
+# "Authorization: Bearer <GVCRUD_METRICS_TOKEN>" (none when it is empty).
+GVCRUD_SERVER_TIMING = True
+GVCRUD_METRICS_TOKEN = os.environ.get('GVCRUD_METRICS_TOKEN', '')
+
+# ProfilingMiddleware profiles this fraction of requests (0 turns
+# sampling off), and any request from a staff user carrying the header.
+# Profiles go to GVCRUD_PROFILE_DIR, newest GVCRUD_PROFILE_KEEP kept;
+# list and read them with "manage.py profiles".
+GVCRUD_PROFILE_SAMPLE_RATE = 0
+GVCRUD_PROFILE_HEADER = 'X-Profile'
+GVCRUD_PROFILE_DIR = BASE_DIR / 'profiles'
+GVCRUD_PROFILE_KEEP = 100
+
+# The list, search and report pages read from these replicas, picked
+# "round-robin" or "least-loaded". After a write the client reads from
+# the primary for GVCRUD_REPLICA_STICKY_SECONDS, which should outlast the
+# replication lag.
+GVCRUD_REPLICAS = tuple(alias for alias in DATABASES if alias != 'default')
+GVCRUD_REPLICA_SELECTION = os.environ.get('GVCRUD_REPLICA_SELECTION', 'round-robin')
+GVCRUD_REPLICA_STICKY_SECONDS = 10
+GVCRUD_REPLICA_COOKIE = 'gvcrud_primary'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -119,6 +217,35 @@ STATIC_ROOT = BASE_DIR / 'static'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Pictures are stored under the hash of their content, so identical
+# uploads share one file; see gvcrud/utils/storage.py.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'pictures': {
+        'BACKEND': 'gvcrud.utils.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Minutes an unreferenced picture is kept after it was last written or
+# uploaded again, before a delete or the collect_pictures command removes it.
+GVCRUD_PICTURE_MIN_AGE = 60
+
+# Pictures are checked while they stream in and dropped as soon as they
+# break a limit; see gvcrud/utils/uploads.py.
+FILE_UPLOAD_HANDLERS = [
+    'gvcrud.utils.uploads.PictureUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+GVCRUD_PICTURE_FIELDS = ('picture',)
+GVCRUD_PICTURE_MAX_SIZE = 5 * 1024 * 1024
+GVCRUD_PICTURE_MAX_DIMENSIONS = (4000, 4000)
+
 LOGIN_URL = 'login'
 LOGIN_URL_REDIRECT = 'person-list'
 LOGOFF_URL_REDIRECT = 'home'
@@ -5,5 +5,6 @@ from gvcrud import views
 urlpatterns = [
     path('', include('gvcrud.urls')),
     path('login/', views.login_auth, name='login-auth'),
-    path('logoff/', views.logoff, name='logoff')
+    path('logoff/', views.logoff, name='logoff'),
+    path('metrics', views.metrics_view, name='metrics')
 ]